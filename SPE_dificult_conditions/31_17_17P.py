@@ -3,13 +3,14 @@
 # Description: This script visualises Spatial Permutation Entropy (SPE) values for Eyes Closed (EC)
 #              and Eyes Open (EO) conditions, using two reduced electrode montages: 31 and 17 channels.
 #              For each montage, it produces a vertical panel with two narrow boxplots – one for the
-#              horizontal SPE and one for the vertical SPE. Independent t‑tests are used to compare EO
+#              horizontal SPE and one for the vertical SPE. Permutation t‑tests are used to compare EO
 #              versus EC, and significance is marked with asterisks.
 # -------------------------------------------
 
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import stats
+from egg_stats import permutation_test
+from egg_store import result_store
 
 # --------------------------------------------------
 # Helper: Convert p‑value into a star annotation
@@ -34,15 +35,19 @@ def get_p_asterisks(p):
 # Horizontal (hor) and vertical (ver) SPE are stored separately.
 # --------------------------------------------------
 
-hc_31 = np.load("vectores_31montaje/spe_hor_closed_raw_wo_31.npy")  # EC horizontal, 31 ch
-ho_31 = np.load("vectores_31montaje/spe_hor_open_raw_wo_31.npy")    # EO horizontal, 31 ch
-vc_31 = np.load("vectores_31montaje/spe_ver_closed_raw_wo_31.npy")  # EC vertical, 31 ch
-vo_31 = np.load("vectores_31montaje/spe_ver_open_raw_wo_31.npy")    # EO vertical, 31 ch
+# They are looked up by parameters in the result store (egg_store.py).
+store = result_store()
+spe = dict(mode="raw", band=None, L=3, lag=1, artifacts="without")
 
-hc_17 = np.load("vectores_17montaje/spe_hor_closed_raw_wo_17.npy")  # EC horizontal, 17 ch
-ho_17 = np.load("vectores_17montaje/spe_hor_open_raw_wo_17.npy")    # EO horizontal, 17 ch
-vc_17 = np.load("vectores_17montaje/spe_ver_closed_raw_wo_17.npy")  # EC vertical, 17 ch
-vo_17 = np.load("vectores_17montaje/spe_ver_open_raw_wo_17.npy")    # EO vertical, 17 ch
+hc_31 = store.get(metric="spe_hor", run=2, montage="31", **spe)  # EC horizontal, 31 ch
+ho_31 = store.get(metric="spe_hor", run=1, montage="31", **spe)  # EO horizontal, 31 ch
+vc_31 = store.get(metric="spe_ver", run=2, montage="31", **spe)  # EC vertical, 31 ch
+vo_31 = store.get(metric="spe_ver", run=1, montage="31", **spe)  # EO vertical, 31 ch
+
+hc_17 = store.get(metric="spe_hor", run=2, montage="17", **spe)  # EC horizontal, 17 ch
+ho_17 = store.get(metric="spe_hor", run=1, montage="17", **spe)  # EO horizontal, 17 ch
+vc_17 = store.get(metric="spe_ver", run=2, montage="17", **spe)  # EC vertical, 17 ch
+vo_17 = store.get(metric="spe_ver", run=1, montage="17", **spe)  # EO vertical, 17 ch
 
 # --------------------------------------------------
 # 2) PREPARE THE DATA  ─────────────────────────────
@@ -113,7 +118,8 @@ for idx, (title, hor_data, ver_data) in enumerate(data_groups):
     # --------------------------------------------------
     for j, (a_idx, b_idx) in enumerate([(1, 2), (4, 5)]):
         # Even indices: EC vs EO in horizontal (j=0) and vertical (j=1)
-        t_stat, p_val = stats.ttest_ind(all_data[j*2], all_data[j*2 + 1], equal_var=False)
+        # permutation test of the Welch t (10000 shuffles of the EC/EO labels)
+        p_val = permutation_test(all_data[j*2], all_data[j*2 + 1], seed=0)['p']
         y_line = y_max + margin * (0.1 + j * 0.2)
         y_bar = y_line + margin * 0.05
         ax.plot([a_idx, a_idx, b_idx, b_idx], [y_line, y_bar, y_bar, y_line], lw=2, color="black")
@@ -1,17 +1,21 @@
 from scipy import stats
 import numpy as np
 import matplotlib.pyplot as plt
+from egg_store import result_store
 
-# Load horizontal and vertical SPE data (with and without artifacts)
-spe_hor_closed_wo = np.load("vectores/primeros_vect/spe_hor_closed_raw_wo.npy")
-spe_hor_open_wo = np.load("vectores/primeros_vect/spe_hor_open_raw_wo.npy")
-spe_hor_closed_w = np.load("vectores/primeros_vect/spe_hor_closed_raw_w.npy")
-spe_hor_open_w = np.load("vectores/primeros_vect/spe_hor_open_raw_w.npy")
+# Load horizontal and vertical SPE data (with and without artifacts) from the result store,
+# the first vectors computed (collection 'primeros_vect')
+store = result_store()
+spe = dict(mode='raw', band=None, L=3, lag=1, montage='64', collection='primeros_vect')
+spe_hor_closed_wo = store.get(metric='spe_hor', run=2, artifacts='without', **spe)
+spe_hor_open_wo = store.get(metric='spe_hor', run=1, artifacts='without', **spe)
+spe_hor_closed_w = store.get(metric='spe_hor', run=2, artifacts='with', **spe)
+spe_hor_open_w = store.get(metric='spe_hor', run=1, artifacts='with', **spe)
 
-spe_ver_closed_wo = np.load("vectores/primeros_vect/spe_ver_closed_raw_wo.npy")
-spe_ver_open_wo = np.load("vectores/primeros_vect/spe_ver_open_raw_wo.npy")
-spe_ver_closed_w = np.load("vectores/primeros_vect/spe_ver_closed_raw_w.npy")
-spe_ver_open_w = np.load("vectores/primeros_vect/spe_ver_open_raw_w.npy")
+spe_ver_closed_wo = store.get(metric='spe_ver', run=2, artifacts='without', **spe)
+spe_ver_open_wo = store.get(metric='spe_ver', run=1, artifacts='without', **spe)
+spe_ver_closed_w = store.get(metric='spe_ver', run=2, artifacts='with', **spe)
+spe_ver_open_w = store.get(metric='spe_ver', run=1, artifacts='with', **spe)
 
 # Function to turn p-values into significance stars
 def get_p_asterisks(p):
@@ -6,6 +6,9 @@ import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 import mne
 from egg_utils_2 import eeg  # Custom EEG analysis class
+from egg_stats import permutation_test
+from egg_checkpoint import checkpoint, eeg_parameters
+from egg_store import result_store
 
 # Define analysis parameters
 number_of_subjects = 109
@@ -26,27 +29,47 @@ for eeg_obj in [eeg_open, eeg_closed]:
     eeg_obj.cut_up = 30
     eeg_obj.cut_low = 12
 
-# Load EEG data
-eeg_open.load_data()
-eeg_closed.load_data()
+# Checkpoints: the SPE of every (subject, run, direction) is saved as soon as it is finished,
+# so if the job is restarted the finished ones are skipped. The folder depends on a hash of
+# the parameters, so changing them does not reuse old results
+ckpt = checkpoint('checkpoints/p_value_spatial', **eeg_parameters(eeg_open, montage='31', measure='par_spatial_2'))
 
-if analysis_mode == 'spatial':
+def spe_unit(task):
+    # SPE of one subject in one direction, from the checkpoint if it was already computed
+    eeg_obj, j, direction = task
+    eeg_obj.set_mode(direction)
+    return ckpt.compute((j, eeg_obj.run, direction), eeg_obj.par_spatial_2, j)
+
+if analysis_mode == 'spatial' and __name__ == '__main__':
+    # Everything that loads or uses the data is only run by the main process. With the spawn
+    # start method (macOS) the workers import this script again, and they only have to attach
+    # to the shared block, not read all the edf files again
     startTime = datetime.now()
+    units = [(j, eeg_obj.run, direction) for direction in ['horizontal', 'vertical']
+             for eeg_obj in [eeg_open, eeg_closed] for j in range(number_of_subjects)]
+    missing = ckpt.pending(units)
+    print(len(units) - len(missing), 'of', len(units), 'results already in', ckpt.folder)
+
+    # Load EEG data (not needed if everything is in the checkpoints) and keep one copy of the
+    # signals in shared memory, each task only sends its name
+    if missing:
+        eeg_open.load_data()
+        eeg_closed.load_data()
+        eeg_open.share_data()
+        eeg_closed.share_data()
 
     # Use multiprocessing to calculate SPE for each subject
-    if __name__ == '__main__':
-        with mp.Pool(mp.cpu_count()) as pool:
-            # Horizontal SPE calculation for EO and EC
-            eeg_open.set_mode("horizontal")
-            eeg_closed.set_mode("horizontal")
-            spe_hor_open = pool.map(eeg_open.par_spatial_2, range(eeg_open.subjects))
-            spe_hor_closed = pool.map(eeg_closed.par_spatial_2, range(eeg_closed.subjects))
-
-            # Vertical SPE calculation for EO and EC
-            eeg_open.set_mode("vertical")
-            eeg_closed.set_mode("vertical")
-            spe_ver_open = pool.map(eeg_open.par_spatial_2, range(eeg_open.subjects))
-            spe_ver_closed = pool.map(eeg_closed.par_spatial_2, range(eeg_closed.subjects))
+    with mp.Pool(mp.cpu_count()) as pool:
+        # Horizontal SPE calculation for EO and EC
+        spe_hor_open = pool.map(spe_unit, [(eeg_open, j, 'horizontal') for j in range(eeg_open.subjects)])
+        spe_hor_closed = pool.map(spe_unit, [(eeg_closed, j, 'horizontal') for j in range(eeg_closed.subjects)])
+
+        # Vertical SPE calculation for EO and EC
+        spe_ver_open = pool.map(spe_unit, [(eeg_open, j, 'vertical') for j in range(eeg_open.subjects)])
+        spe_ver_closed = pool.map(spe_unit, [(eeg_closed, j, 'vertical') for j in range(eeg_closed.subjects)])
+    if missing:
+        eeg_open.release_data()
+        eeg_closed.release_data()
 
     print('Spatial Analysis completed.')
     print('Time elapsed:', str(datetime.now() - startTime))
@@ -64,10 +87,21 @@ if analysis_mode == 'spatial':
     t_ver, p_ver = stats.ttest_ind(spe_ver_open, spe_ver_closed, equal_var=False)
     print(f'T-test Vertical: t={t_ver}, p={p_ver}')
 
+    # Permutation tests (EO/EC labels shuffled, no normality assumed), with the p corrected
+    # for all the tests at the same time by the max-statistic method
+    perm_hor = permutation_test(spe_hor_open, spe_hor_closed, seed=0)
+    print(f"Permutation test Horizontal: p={perm_hor['p']}, p (FWER)={perm_hor['p_fwer']}")
+
+    perm_ver = permutation_test(spe_ver_open, spe_ver_closed, seed=0)
+    print(f"Permutation test Vertical: p={perm_ver['p']}, p (FWER)={perm_ver['p_fwer']}")
+
     print("T-tests for spatial analysis completed.")
 
-    # Save results as .npy files
-    np.save("spe_hor_open_raw_wo_31.npy", spe_hor_open)
-    np.save("spe_hor_closed_raw_wo_31.npy", spe_hor_closed)
-    np.save("spe_ver_open_raw_wo_31.npy", spe_ver_open)
-    np.save("spe_ver_closed_raw_wo_31.npy", spe_ver_closed)
+    # Save results in the result store (egg_store.py), where 31_17_17P.py looks them up
+    store = result_store()
+    params = dict(mode=filt_mode, band=None if filt_mode == 'raw' else 'beta', L=word_length, lag=lag,
+                  montage='31', artifacts='without')
+    store.put(spe_hor_open, metric='spe_hor', run=1, **params)
+    store.put(spe_hor_closed, metric='spe_hor', run=2, **params)
+    store.put(spe_ver_open, metric='spe_ver', run=1, **params)
+    store.put(spe_ver_closed, metric='spe_ver', run=2, **params)
@@ -1,36 +1,33 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.stats import ttest_rel
-
-# ---------- Load artifact-free SPE data (first 1000 time points) ----------
-hor_closed = np.load('vectores/spe_hor_closed_raw_wo.npy')[:, :1000]  # Horizontal, EC
-hor_open   = np.load('vectores/spe_hor_open_raw_wo.npy')[:, :1000]    # Horizontal, EO
-ver_closed = np.load('vectores/spe_ver_closed_raw_wo.npy')[:, :1000]  # Vertical, EC
-ver_open   = np.load('vectores/spe_ver_open_raw_wo.npy')[:, :1000]    # Vertical, EO
-
-# Time axis from 1 to 1000
+from egg_cumulative import running_mean_std, running_paired_pvalues
+from egg_store import result_store
+
+# Number of time points analysed (None = the whole recording, 9440 samples)
+N_POINTS = 1000
+
+# ---------- Load artifact-free SPE data (first N_POINTS time points) ----------
+# (from the result store, opened with mmap so only the first N_POINTS are read)
+store = result_store()
+spe = dict(mode='raw', band=None, L=3, lag=1, montage='64', artifacts='without', collection='vectores')
+hor_closed = store.get(metric='spe_hor', run=2, **spe)[:, :N_POINTS]  # Horizontal, EC
+hor_open   = store.get(metric='spe_hor', run=1, **spe)[:, :N_POINTS]  # Horizontal, EO
+ver_closed = store.get(metric='spe_ver', run=2, **spe)[:, :N_POINTS]  # Vertical, EC
+ver_open   = store.get(metric='spe_ver', run=1, **spe)[:, :N_POINTS]  # Vertical, EO
+
+# Time axis from 1 to N_POINTS
 time_points = np.arange(1, hor_open.shape[1] + 1)
 
 # ---------- Function to compute average and standard deviation of SPE over time ----------
 def compute_mean_over_time(data):
-    means, stds = [], []
-    for t in time_points:
-        # For each subject, average SPE values from time 0 to t
-        subject_means = np.mean(data[:, :t], axis=1)
-        means.append(np.mean(subject_means))     # Mean over all subjects
-        stds.append(np.std(subject_means))       # Std deviation across subjects
-    return np.array(means), np.array(stds)
+    # For each subject, average SPE values from time 0 to t (all t at once with cumulative sums),
+    # then mean and std deviation across subjects
+    return running_mean_std(data)
 
 # ---------- Function to compute p-values at each time step ----------
 def compute_temporal_pvalues(open_data, closed_data):
-    pvalues = []
-    for t in time_points:
-        # For each subject, compute average up to time t for EO and EC
-        data_open = np.mean(open_data[:, :t], axis=1)
-        data_closed = np.mean(closed_data[:, :t], axis=1)
-        pval = ttest_rel(data_open, data_closed).pvalue  # Paired t-test
-        pvalues.append(pval)
-    return np.array(pvalues)
+    # Paired t-test between EO and EC averages up to time t, for every t
+    return running_paired_pvalues(open_data, closed_data)
 
 # ---------- Compute metrics ----------
 # Horizontal SPE
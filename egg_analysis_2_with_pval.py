@@ -16,6 +16,7 @@ In general, this script helped me understand whether there are real differences
 import numpy as np
 from scipy import stats
 import matplotlib.pyplot as plt
+from egg_store import result_store
 
 # This script loads precomputed Spatial Permutation Entropy (SPE) results 
 # from EEG signals for eyes open (EO) and eyes closed (EC) conditions.
@@ -23,13 +24,17 @@ import matplotlib.pyplot as plt
 # the differences between both conditions.
 
 # ====== Load SPE data ======
+# Looked up by parameters in the result store (egg_store.py), without artifacts, 64 electrodes
+store = result_store()
+spe = dict(mode='raw', band=None, L=3, lag=1, montage='64', artifacts='without', collection='vectores')
+
 # Horizontal configuration
-spe_hor_closed = np.load("vectores/spe_hor_closed_raw_wo.npy")
-spe_hor_open = np.load("vectores/spe_hor_open_raw_wo.npy")
+spe_hor_closed = store.get(metric='spe_hor', run=2, **spe)
+spe_hor_open = store.get(metric='spe_hor', run=1, **spe)
 
 # Vertical configuration
-spe_ver_closed = np.load("vectores/spe_ver_closed_raw_wo.npy")
-spe_ver_open = np.load("vectores/spe_ver_open_raw_wo.npy")
+spe_ver_closed = store.get(metric='spe_ver', run=2, **spe)
+spe_ver_open = store.get(metric='spe_ver', run=1, **spe)
 
 # ====== Define function to get p-value significance as stars ======
 def get_p_asterisks(p):
@@ -0,0 +1,102 @@
+"""
+Checkpoints for the long analyses (p_value_spatial.py, egg_sweep.py), so that if a run
+crashes or is stopped, starting it again only computes what was missing.
+
+Every unit of work (one subject, run and configuration) is saved in its own file as soon as it
+is finished. The file is written with another name and renamed at the end, so a file that
+exists is always complete. The files are kept in a folder named with a hash of the analysis
+parameters (mode, cut frequencies, L, lag, montage...), so if any parameter changes the old
+results are not used, they just stay in another folder.
+
+    ckpt = checkpoint('checkpoints/p_value_spatial', **eeg_parameters(eeg_open))
+    spe = ckpt.compute((j, run, 'horizontal'), eeg_open.par_spatial_2, j)
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+
+
+def parameter_hash(params):
+    # Short hash of a dictionary of parameters (same parameters -> same hash)
+    text = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def eeg_parameters(eeg_obj, **extra):
+    # Parameters of an eeg object that change its results (the run and the direction are part
+    # of the unit of work, not of the parameters). extra adds anything else, e.g. the montage
+    params = {'mode': eeg_obj.mode, 'cut_low': eeg_obj.cut_low, 'cut_up': eeg_obj.cut_up,
+              'L': eeg_obj.L, 'lag': eeg_obj.lag, 'max_time': eeg_obj.max_time,
+              'file_path': eeg_obj.file_path, 'filter_method': eeg_obj.filter_method}
+    if eeg_obj.filter_method == 'iir':
+        params['iir_order'] = eeg_obj.iir_order
+    params.update(extra)
+    return params
+
+
+def atomic_save(path, value):
+    # Writes value (an array, or a dict of arrays as .npz) to a temporary file and renames it,
+    # so path never has a half written file
+    tmp = path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp, 'wb') as f:
+        if isinstance(value, dict):
+            np.savez(f, **value)
+        else:
+            np.save(f, value)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class checkpoint:
+
+    def __init__(self, folder, **params):
+        self.params = params
+        self.folder = os.path.join(folder, parameter_hash(params))
+        os.makedirs(self.folder, exist_ok=True)
+        # the parameters are saved next to the results, to know what each folder is
+        info = os.path.join(self.folder, 'params.json')
+        if not os.path.exists(info):
+            tmp = info + '.' + str(os.getpid()) + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(params, f, sort_keys=True, indent=1, default=str)
+            os.replace(tmp, info)
+
+    def path(self, unit):
+        # File of a unit of work, e.g. (subject, run, 'horizontal') -> S001_run_1_horizontal
+        subject, run = unit[0], unit[1]
+        name = 'S' + str(subject + 1).zfill(3) + '_run_' + str(run)
+        for part in unit[2:]:
+            name += '_' + str(part)
+        return os.path.join(self.folder, name)
+
+    def done(self, unit):
+        base = self.path(unit)
+        return os.path.exists(base + '.npy') or os.path.exists(base + '.npz')
+
+    def save(self, unit, value):
+        base = self.path(unit)
+        atomic_save(base + ('.npz' if isinstance(value, dict) else '.npy'), value)
+
+    def load(self, unit):
+        base = self.path(unit)
+        if os.path.exists(base + '.npz'):
+            with np.load(base + '.npz') as f:
+                return {name: f[name][()] for name in f.files}
+        return np.load(base + '.npy')[()]
+
+    def compute(self, unit, func, *args):
+        # The saved result of the unit if it is done, otherwise func(*args), saved before returning
+        if self.done(unit):
+            return self.load(unit)
+        value = func(*args)
+        if not isinstance(value, dict):
+            value = np.asarray(value)
+        self.save(unit, value)
+        return value
+
+    def pending(self, units):
+        # Units that still have to be computed
+        return [unit for unit in units if not self.done(unit)]
@@ -0,0 +1,44 @@
+"""
+Statistics over cumulative time windows (from the first sample up to t, for every t).
+
+I use it to see how the difference between Eyes Open (EO) and Eyes Closed (EC) evolves
+as more of the recording is analysed (tiempo.py). Instead of recomputing
+np.mean(data[:, :t], axis=1) for every t, everything comes from cumulative sums, so
+all the prefix lengths of a (subjects, time) array are obtained in one pass and the
+figures can use the whole 9440 samples.
+"""
+
+import numpy as np
+from scipy import stats
+
+
+def prefix_means(data):
+    # Mean of data[..., :t] for t = 1 ... T, same shape as data (last axis is time)
+    data = np.asarray(data, dtype=float)
+    return np.cumsum(data, axis=-1)/np.arange(1, data.shape[-1] + 1)
+
+
+def prefix_stds(data):
+    # Standard deviation of data[..., :t] for t = 1 ... T, from the cumulative sums of
+    # the values and of their squares
+    data = np.asarray(data, dtype=float)
+    mean = prefix_means(data)
+    mean_sq = np.cumsum(data**2, axis=-1)/np.arange(1, data.shape[-1] + 1)
+    return np.sqrt(np.maximum(mean_sq - mean**2, 0))
+
+
+def running_mean_std(data):
+    # data is (subjects, time). For every t, the mean and std across subjects of each
+    # subject's average up to t (what compute_mean_over_time did in tiempo.py)
+    means = prefix_means(data)
+    return np.mean(means, axis=0), np.std(means, axis=0)
+
+
+def running_paired_pvalues(data_a, data_b):
+    # Paired t-test between the subject averages up to t of two conditions, for every t.
+    # Same result as ttest_rel(np.mean(a[:, :t], 1), np.mean(b[:, :t], 1)) for each t
+    diff = prefix_means(data_a) - prefix_means(data_b)
+    n = diff.shape[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.mean(diff, axis=0)/(np.std(diff, axis=0, ddof=1)/np.sqrt(n))
+    return 2*stats.t.sf(np.abs(t), n - 1)
@@ -0,0 +1,333 @@
+"""
+Statistics to compare two conditions (Eyes Open vs Eyes Closed) for all the channels at once.
+
+The inputs are arrays of shape (subjects, channels, ...) with the value of each subject,
+for example the PE, skewness or kurtosis of every channel (or several features stacked
+in the last axes). Instead of calling stats.ttest_ind channel by channel, the tests are
+computed for all the channels in one call, and since we are doing 64 (or more) tests at
+the same time, the significance masks are also given after multiple comparison correction
+(Benjamini-Hochberg FDR and Bonferroni).
+
+    from egg_stats import compare
+    res = compare(pe_eyes_open, pe_eyes_closed)
+    res['p_welch'], res['fdr_welch'], res['d']
+
+The entropies are bounded and not always normal, so there are also permutation tests
+(sign flips of the paired differences or shuffles of the EO/EC labels) and bootstrap
+confidence intervals. Each block of permutations is a matrix product over all the
+channels at once, and the blocks run in parallel threads:
+
+    perm = permutation_test(pe_eyes_open, pe_eyes_closed, paired=True)
+    perm['p'], perm['p_fwer']
+
+For maps of electrodes there is a cluster permutation test: neighbouring electrodes (from
+their positions, e.g. eeg.get_pos()) with a large t in the same direction are joined into
+clusters, and the mass of each cluster is compared with the largest cluster mass of every
+permutation:
+
+    clus = cluster_test(pe_eyes_open, pe_eyes_closed, adjacency(eeg_open.get_pos()))
+    clus['clusters'], clus['cluster_p'], clus['mask']
+"""
+
+import os
+import numpy as np
+from scipy import stats, sparse
+from scipy.sparse.csgraph import connected_components
+from concurrent.futures import ThreadPoolExecutor
+
+
+def welch_t(a, b):
+    # Welch t-test (unequal variances) along the subjects axis, same as
+    # stats.ttest_ind(a, b, axis=0, equal_var=False). Returns t, degrees of freedom and p
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    na, nb = a.shape[0], b.shape[0]
+    va = np.var(a, axis=0, ddof=1)/na
+    vb = np.var(b, axis=0, ddof=1)/nb
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (np.mean(a, axis=0) - np.mean(b, axis=0))/np.sqrt(va + vb)
+        df = (va + vb)**2/(va**2/(na - 1) + vb**2/(nb - 1))
+    return t, df, 2*stats.t.sf(np.abs(t), df)
+
+
+def paired_t(a, b):
+    # Paired t-test along the subjects axis (the same subjects in both conditions), same as
+    # stats.ttest_rel(a, b, axis=0). Returns t, degrees of freedom and p
+    diff = np.asarray(a, dtype=float) - np.asarray(b, dtype=float)
+    n = diff.shape[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.mean(diff, axis=0)/(np.std(diff, axis=0, ddof=1)/np.sqrt(n))
+    return t, n - 1, 2*stats.t.sf(np.abs(t), n - 1)
+
+
+def cohens_d(a, b):
+    # Effect size between the two groups: difference of means over the pooled std
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    na, nb = a.shape[0], b.shape[0]
+    pooled = ((na - 1)*np.var(a, axis=0, ddof=1) + (nb - 1)*np.var(b, axis=0, ddof=1))/(na + nb - 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (np.mean(a, axis=0) - np.mean(b, axis=0))/np.sqrt(pooled)
+
+
+def cohens_dz(a, b):
+    # Effect size of the paired differences: mean difference over the std of the differences
+    diff = np.asarray(a, dtype=float) - np.asarray(b, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.mean(diff, axis=0)/np.std(diff, axis=0, ddof=1)
+
+
+def fdr_pvalues(p):
+    # Benjamini-Hochberg adjusted p-values. All the values of p are one family of tests
+    # (all channels and features); NaN p-values (constant channels) are left out of the count
+    p = np.asarray(p, dtype=float)
+    flat = p.ravel()
+    valid = np.flatnonzero(~np.isnan(flat))
+    adjusted = np.full(flat.shape, np.nan)
+    if len(valid):
+        order = valid[np.argsort(flat[valid])]
+        m = len(order)
+        scaled = flat[order]*m/np.arange(1, m + 1)
+        # the adjusted p of a rank is the minimum over that rank and all the larger ones
+        adjusted[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1)
+    return adjusted.reshape(p.shape)
+
+
+def bonferroni_pvalues(p):
+    # Bonferroni adjusted p-values (p times the number of valid tests, up to 1)
+    p = np.asarray(p, dtype=float)
+    return np.minimum(p*np.count_nonzero(~np.isnan(p)), 1)
+
+
+def compare(data_a, data_b, alpha=0.05):
+    # All the statistics between condition a and condition b, (subjects, channels, ...) each.
+    # Every output has the shape of one subject (channels, ...). The paired test is only done
+    # when both conditions have the same subjects (same number of rows)
+    data_a = np.asarray(data_a, dtype=float)
+    data_b = np.asarray(data_b, dtype=float)
+    if data_a.shape[1:] != data_b.shape[1:]:
+        raise Exception('Both conditions must have the same channels/features, got ' + str(data_a.shape) + ' and ' + str(data_b.shape))
+
+    res = {'mean_a': np.mean(data_a, axis=0), 'mean_b': np.mean(data_b, axis=0)}
+    res['diff'] = res['mean_a'] - res['mean_b']
+    res['t_welch'], res['df_welch'], res['p_welch'] = welch_t(data_a, data_b)
+    res['d'] = cohens_d(data_a, data_b)
+    tests = ['welch']
+    if data_a.shape[0] == data_b.shape[0]:
+        res['t_paired'], res['df_paired'], res['p_paired'] = paired_t(data_a, data_b)
+        res['dz'] = cohens_dz(data_a, data_b)
+        tests.append('paired')
+
+    for test in tests:
+        p = res['p_' + test]
+        res['p_fdr_' + test] = fdr_pvalues(p)
+        res['p_bonferroni_' + test] = bonferroni_pvalues(p)
+        # NaN compares as False, so constant channels are never significant
+        res['significant_' + test] = p < alpha
+        res['fdr_' + test] = res['p_fdr_' + test] < alpha
+        res['bonferroni_' + test] = res['p_bonferroni_' + test] < alpha
+    return res
+
+
+def summary(res, name=''):
+    # Prints how many channels are significant before and after the corrections
+    for test in ['welch', 'paired']:
+        if 'p_' + test in res:
+            print(name, test, 't-test: significant (p < alpha) =', np.count_nonzero(res['significant_' + test]),
+                  ', FDR =', np.count_nonzero(res['fdr_' + test]),
+                  ', Bonferroni =', np.count_nonzero(res['bonferroni_' + test]),
+                  'of', res['p_' + test].size)
+
+
+def _blocks(n, chunk, seed, workers, func):
+    # Runs func(size, seed_sequence) for blocks of up to `chunk` resamples (n in total) in a
+    # thread pool (the matrix products release the GIL). Every block has its own seed from
+    # SeedSequence, so the result only depends on seed, not on the number of workers
+    sizes = [min(chunk, n - first) for first in range(0, n, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    with ThreadPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        return list(pool.map(func, sizes, seeds))
+
+
+def _flat(data):
+    # (subjects, ...) -> (subjects, tests), so any number of channel/feature axes works
+    data = np.asarray(data, dtype=float)
+    return data.reshape(data.shape[0], -1)
+
+
+def _t_permutations(data_a, data_b, paired):
+    # Observed t of every test and a function block(size, seed_seq) that gives the t of `size`
+    # random permutations, (size, tests), both for the flattened (subjects, tests) data.
+    # paired=True: the sign of each subject's difference a-b is flipped at random (paired t)
+    # paired=False: the subjects are shuffled between the two groups (Welch t)
+    a, b = _flat(data_a), _flat(data_b)
+    if a.shape[1] != b.shape[1]:
+        raise Exception('Both conditions must have the same channels/features, got ' + str(np.shape(data_a)) + ' and ' + str(np.shape(data_b)))
+
+    if paired:
+        if a.shape[0] != b.shape[0]:
+            raise Exception('Paired test needs the same subjects in both conditions')
+        diff = a - b
+        n = diff.shape[0]
+        sum_sq = np.sum(diff**2, axis=0)  # does not change when flipping signs
+
+        def t_of(sums):
+            # paired t from the sums of the (flipped) differences, (k, tests)
+            mean = sums/n
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return mean/np.sqrt((sum_sq - n*mean**2)/(n - 1)/n)
+
+        observed = t_of(np.sum(diff, axis=0))
+
+        def block(size, seed_seq):
+            rng = np.random.default_rng(seed_seq)
+            signs = rng.integers(0, 2, size=(size, n))*2 - 1.0
+            return t_of(signs @ diff)
+    else:
+        na, nb = a.shape[0], b.shape[0]
+        pooled = np.concatenate([a, b])
+        pooled -= np.mean(pooled, axis=0)  # t does not change, and the sums of squares are more precise
+        pooled_sq = pooled**2
+        total, total_sq = np.sum(pooled, axis=0), np.sum(pooled_sq, axis=0)
+
+        def t_of(sum_a, sq_a):
+            # Welch t from the sums of the values and squares in group a, (k, tests)
+            mean_a, mean_b = sum_a/na, (total - sum_a)/nb
+            var_a = (sq_a - na*mean_a**2)/(na - 1)
+            var_b = (total_sq - sq_a - nb*mean_b**2)/(nb - 1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return (mean_a - mean_b)/np.sqrt(var_a/na + var_b/nb)
+
+        observed = t_of(np.sum(pooled[:na], axis=0), np.sum(pooled_sq[:na], axis=0))
+        membership = np.r_[np.ones(na), np.zeros(nb)]
+
+        def block(size, seed_seq):
+            rng = np.random.default_rng(seed_seq)
+            # each row says which subjects go to group a in one permutation
+            groups = rng.permuted(np.tile(membership, (size, 1)), axis=1)
+            return t_of(groups @ pooled, groups @ pooled_sq)
+
+    return observed, block
+
+
+def permutation_test(data_a, data_b, paired=False, n_permutations=10000, seed=None, workers=None, chunk=500):
+    # Permutation t-test between condition a and b, (subjects, channels, ...) each, with sign
+    # flips (paired=True) or label shuffles (paired=False), see _t_permutations.
+    # Returns the observed t, the permutation p of every test and the p corrected for all the
+    # tests with the max-statistic method (family-wise error rate), with the shape of one subject
+    shape = np.shape(data_a)[1:]
+    observed, block = _t_permutations(data_a, data_b, paired)
+    threshold = np.abs(observed)
+
+    def counts(size, seed_seq):
+        null = np.abs(block(size, seed_seq))
+        # NaN (constant channels) never counts and is left out of the maximum
+        return np.sum(null >= threshold, axis=0), np.max(np.where(np.isnan(null), -np.inf, null), axis=1)
+
+    results = _blocks(n_permutations, chunk, seed, workers, counts)
+    exceed = sum(r[0] for r in results)
+    max_null = np.concatenate([r[1] for r in results])
+    p = (1 + exceed)/(1 + n_permutations)
+    p_fwer = (1 + np.sum(max_null[:, None] >= threshold, axis=0))/(1 + n_permutations)
+    p[np.isnan(observed)] = np.nan
+    p_fwer[np.isnan(observed)] = np.nan
+    return {'t': observed.reshape(shape), 'p': p.reshape(shape), 'p_fwer': p_fwer.reshape(shape),
+            'max_null': max_null}
+
+
+def bootstrap_ci(data_a, data_b, paired=False, n_boot=10000, ci=0.95, seed=None, workers=None, chunk=500):
+    # Bootstrap confidence interval of the difference of means (a - b) for every test.
+    # The resamples are counts of how many times each subject is drawn, so the means of a whole
+    # block are one matrix product. paired=True resamples subjects (their differences a-b),
+    # paired=False resamples each group on its own. Returns the difference, low and high limits
+    shape = np.shape(data_a)[1:]
+    a, b = _flat(data_a), _flat(data_b)
+    if paired:
+        if a.shape[0] != b.shape[0]:
+            raise Exception('Paired bootstrap needs the same subjects in both conditions')
+        diff = a - b
+        n = diff.shape[0]
+
+        def block(size, seed_seq):
+            rng = np.random.default_rng(seed_seq)
+            return rng.multinomial(n, np.full(n, 1/n), size=size) @ diff/n
+        estimate = np.mean(diff, axis=0)
+    else:
+        na, nb = a.shape[0], b.shape[0]
+
+        def block(size, seed_seq):
+            rng = np.random.default_rng(seed_seq)
+            return (rng.multinomial(na, np.full(na, 1/na), size=size) @ a/na
+                    - rng.multinomial(nb, np.full(nb, 1/nb), size=size) @ b/nb)
+        estimate = np.mean(a, axis=0) - np.mean(b, axis=0)
+
+    boot = np.concatenate(_blocks(n_boot, chunk, seed, workers, block))
+    low, high = np.quantile(boot, [(1 - ci)/2, (1 + ci)/2], axis=0)
+    return estimate.reshape(shape), low.reshape(shape), high.reshape(shape)
+
+
+def adjacency(positions, distance=None):
+    # Sparse (channels, channels) matrix of neighbouring electrodes: the ones closer than
+    # `distance` (same units as the positions). By default 1.5 times the median distance of
+    # each electrode to its nearest one, so it works for any montage/head size
+    positions = np.asarray(positions, dtype=float)
+    dist = np.sqrt(np.sum((positions[:, None] - positions[None])**2, axis=-1))
+    np.fill_diagonal(dist, np.inf)
+    if distance is None:
+        distance = 1.5*np.median(np.min(dist, axis=1))
+    return sparse.csr_matrix(dist < distance)
+
+
+def _cluster_masses(t, threshold, edges):
+    # Clusters of the t maps of several permutations at once, t is (k, channels). The channels
+    # with |t| > threshold are joined with their neighbours that pass with the same sign. The k
+    # maps are one block-diagonal graph (node p*channels + i), so a single connected_components
+    # call labels all of them. Returns the labels of the nodes, the permutation and the mass
+    # (sum of |t|) of each cluster
+    k, m = t.shape
+    sign = np.where(np.abs(t) > threshold, np.sign(t), 0)  # NaN does not pass
+    i, j = edges
+    active = (sign[:, i] == sign[:, j]) & (sign[:, i] != 0)
+    perm, edge = np.nonzero(active)
+    graph = sparse.coo_matrix((np.ones(len(perm), dtype=bool), (perm*m + i[edge], perm*m + j[edge])), shape=(k*m, k*m))
+    n_clusters, labels = connected_components(graph, directed=False)
+    mass = np.bincount(labels, weights=np.abs(np.nan_to_num(t)).ravel()*(sign != 0).ravel(), minlength=n_clusters)
+    owner = np.zeros(n_clusters, dtype=int)
+    owner[labels] = np.arange(k*m)//m
+    return labels, owner, mass
+
+
+def cluster_test(data_a, data_b, adjacency, paired=False, alpha=0.05, threshold=None,
+                 n_permutations=5000, seed=None, workers=None, chunk=200):
+    # Cluster permutation test over the electrodes (data is (subjects, channels)). The
+    # channels whose t passes `threshold` (by default the two-sided t of p = alpha) form
+    # clusters with their neighbours in `adjacency`; each cluster is significant if its mass is
+    # larger than the largest cluster mass of (1 - alpha) of the permutations. Returns the
+    # observed t, the clusters (arrays of channels), their mass and p, the p of the cluster of
+    # every channel (1 outside clusters) and the mask of the channels in significant clusters
+    observed, block = _t_permutations(data_a, data_b, paired)
+    if observed.shape != (adjacency.shape[0],):
+        raise Exception('The data must be (subjects, channels) with the channels of the adjacency matrix')
+    if threshold is None:
+        na, nb = np.shape(data_a)[0], np.shape(data_b)[0]
+        threshold = stats.t.ppf(1 - alpha/2, na - 1 if paired else na + nb - 2)
+    upper = sparse.triu(adjacency, k=1).tocoo()
+    edges = (upper.row, upper.col)
+
+    labels, owner, mass = _cluster_masses(observed[None], threshold, edges)
+    found = np.flatnonzero(mass > 0)
+
+    def max_mass(size, seed_seq):
+        _, owner, mass = _cluster_masses(block(size, seed_seq), threshold, edges)
+        largest = np.zeros(size)
+        np.maximum.at(largest, owner, mass)
+        return largest
+
+    max_null = np.concatenate(_blocks(n_permutations, chunk, seed, workers, max_mass))
+    cluster_p = (1 + np.sum(max_null[:, None] >= mass[found], axis=0))/(1 + n_permutations)
+    clusters = [np.flatnonzero(labels == c) for c in found]
+    channel_p = np.ones(len(observed))
+    for members, p in zip(clusters, cluster_p):
+        channel_p[members] = p
+    return {'t': observed, 'threshold': threshold, 'clusters': clusters, 'cluster_mass': mass[found],
+            'cluster_p': cluster_p, 'channel_p': channel_p, 'mask': channel_p < alpha, 'max_null': max_null}
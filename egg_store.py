@@ -0,0 +1,174 @@
+"""
+Store of results (arrays of subjects x channels, subjects x time...) looked up by the
+parameters of the analysis instead of by file name.
+
+Until now every script saved its results with a name made by hand (vectores/spe_hor_open_raw_wo.npy,
+MATRIX_FINAL_VALUES/EC_pe_raw_4_1_w.npy and EO_pe_raw_4_1_W.npy for the same thing...) and the
+plotting scripts had to know these names. Here each result is saved as a .npy file named with a
+hash of its parameters (metric, L, lag, mode, montage, band, artifacts, run, ...) and a small
+index.json keeps the parameters of every file. Results are opened with mmap, so nothing is
+read until it is used and nothing is copied.
+
+    store = result_store()
+    store.put(spe_hor_open, metric='spe_hor', run=1, mode='raw', band=None, L=3, lag=1, montage='31', artifacts='without')
+    spe = store.get(metric='spe_hor', run=1, montage='31', artifacts='without')
+
+The old files are in LEGACY with their parameters, and they are added to the index (without
+copying them) the first time the store is opened from the folder where they are. The case of
+the names (_w / _W, _wo / _Wo) does not matter when looking for them.
+"""
+
+import os
+import json
+import numpy as np
+from egg_checkpoint import parameter_hash, atomic_save
+
+# Parameters that identify a result. Others can be added (e.g. 'collection' for the old files
+# that exist in several folders, 'channels' for the 59 channel ones)
+KEY_FIELDS = ('metric', 'L', 'lag', 'mode', 'montage', 'band', 'artifacts', 'run')
+
+
+def legacy_files():
+    # (path, parameters) of the result files saved before the store. run 1 = Eyes Open (EO),
+    # run 2 = Eyes Closed (EC); '_w' is with the blink artifacts and '_wo' without them
+    files = []
+    conditions = [('open', 'EO', 1), ('closed', 'EC', 2)]
+    for direction in ['hor', 'ver']:
+        for condition, _, run in conditions:
+            spe = {'metric': 'spe_' + direction, 'run': run, 'mode': 'raw', 'band': None, 'L': 3, 'lag': 1}
+            files.append(('vectores/spe_' + direction + '_' + condition + '_raw_wo.npy',
+                          dict(spe, montage='64', artifacts='without', collection='vectores')))
+            for montage in ['31', '17']:
+                files.append(('vectores_' + montage + 'montaje/spe_' + direction + '_' + condition + '_raw_wo_' + montage + '.npy',
+                              dict(spe, montage=montage, artifacts='without', collection='vectores_' + montage + 'montaje')))
+            for suffix, artifacts in [('w', 'with'), ('wo', 'without')]:
+                files.append(('vectores/primeros_vect/spe_' + direction + '_' + condition + '_raw_' + suffix + '.npy',
+                              dict(spe, montage='64', artifacts=artifacts, collection='primeros_vect')))
+    for _, prefix, run in conditions:
+        for metric in ['pe', 'skew', 'kurt']:
+            for band_name, mode, band in [('raw', 'raw', None), ('beta', 'filt', 'beta')]:
+                for suffix, artifacts in [('w', 'with'), ('wo', 'without')]:
+                    files.append(('MATRIX_FINAL_VALUES/' + prefix + '_' + metric + '_' + band_name + '_4_1_' + suffix + '.npy',
+                                  {'metric': metric, 'run': run, 'mode': mode, 'band': band, 'L': 4, 'lag': 1,
+                                   'montage': '64', 'artifacts': artifacts, 'collection': 'MATRIX_FINAL_VALUES'}))
+        folder = 'tabla_pe_skew_kurt_raw_rawwo_bewo/'
+        for suffix, artifacts in [('_w', 'with'), ('', 'without')]:
+            files.append((folder + prefix + '_PE_raw_4_1' + suffix + '.npy',
+                          {'metric': 'pe', 'run': run, 'mode': 'raw', 'band': None, 'L': 4, 'lag': 1,
+                           'montage': '64', 'artifacts': artifacts, 'collection': 'tabla_pe_skew_kurt'}))
+        # the scripts use these _W_59 files as the ones without artifacts (59 channels)
+        for metric, name in [('pe', 'PE'), ('skew', 'skewness'), ('kurt', 'kurtosis')]:
+            files.append((folder + prefix + '_' + name + '_ALPHA_4_1_W_59.npy',
+                          {'metric': metric, 'run': run, 'mode': 'filt', 'band': 'alpha', 'L': 4, 'lag': 1,
+                           'montage': '64', 'artifacts': 'without', 'channels': 59, 'collection': 'tabla_pe_skew_kurt'}))
+    return files
+
+
+LEGACY = legacy_files()
+# position of each old file in LEGACY, to choose one when several match (the first one wins)
+LEGACY_RANK = {parameter_hash(params): k for k, (_, params) in enumerate(LEGACY)}
+
+
+def find_file(path):
+    # path if it exists, if not a file of the same folder whose name only differs in upper/lower case
+    if os.path.exists(path):
+        return path
+    folder, name = os.path.split(path)
+    if os.path.isdir(folder or '.'):
+        for candidate in os.listdir(folder or '.'):
+            if candidate.lower() == name.lower():
+                return os.path.join(folder, candidate)
+    return None
+
+
+class result_store:
+
+    def __init__(self, folder='results', legacy=True):
+        self.folder = folder
+        self.index_path = os.path.join(folder, 'index.json')
+        os.makedirs(folder, exist_ok=True)
+        self.entries = self.read_index()
+        if legacy:
+            self.register_legacy()
+
+    def read_index(self):
+        if not os.path.exists(self.index_path):
+            return []
+        with open(self.index_path) as f:
+            return json.load(f)['entries']
+
+    def write_index(self):
+        # The index is read again before writing, so entries added by another process are kept
+        # (the last one written wins for the same parameters)
+        merged = {parameter_hash(entry['params']): entry for entry in self.read_index()}
+        merged.update({parameter_hash(entry['params']): entry for entry in self.entries})
+        self.entries = list(merged.values())
+        tmp = self.index_path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'entries': self.entries}, f, indent=1, default=str)
+        os.replace(tmp, self.index_path)
+
+    def add(self, params, path, shape, dtype, legacy=False):
+        key = parameter_hash(params)
+        self.entries = [entry for entry in self.entries if parameter_hash(entry['params']) != key]
+        self.entries.append({'params': params, 'file': path, 'shape': list(shape), 'dtype': str(dtype), 'legacy': legacy})
+
+    def put(self, array, **params):
+        # Saves array with its parameters (the same parameters replace the previous result)
+        missing = [key for key in KEY_FIELDS if key not in params]
+        if missing:
+            raise Exception('Missing parameters of the result: ' + str(missing))
+        array = np.asarray(array)
+        name = parameter_hash(params) + '.npy'
+        atomic_save(os.path.join(self.folder, name), array)
+        self.add(params, name, array.shape, array.dtype)
+        self.write_index()
+        return name
+
+    def register(self, path, **params):
+        # Adds an existing .npy file to the index without copying it
+        array = np.load(path, mmap_mode='r')
+        self.add(params, os.path.abspath(path), array.shape, array.dtype, legacy=True)
+
+    def register_legacy(self, root='.'):
+        # Adds the files of LEGACY found under root that are not in the index yet
+        known = {parameter_hash(entry['params']) for entry in self.entries}
+        added = 0
+        for path, params in LEGACY:
+            if parameter_hash(params) in known:
+                continue
+            found = find_file(os.path.join(root, path))
+            if found is not None:
+                self.register(found, **params)
+                added += 1
+        if added:
+            self.write_index()
+        return added
+
+    def find(self, **params):
+        # Parameters of all the results that have the given values
+        return [entry['params'] for entry in self.matches(params)]
+
+    def matches(self, params):
+        return [entry for entry in self.entries
+                if all(key in entry['params'] and entry['params'][key] == value for key, value in params.items())]
+
+    def get(self, **params):
+        # The result with the given parameters, opened with mmap (read only, loaded when used).
+        # If a new result and an old file both match, the new one is used. If only old files
+        # match, the first one of LEGACY is used (e.g. vectores/ before vectores/primeros_vect/)
+        found = self.matches(params)
+        if len(found) > 1:
+            found = [entry for entry in found if not entry['legacy']] or found
+        if len(found) > 1 and all(entry['legacy'] for entry in found):
+            found = [min(found, key=lambda entry: LEGACY_RANK.get(parameter_hash(entry['params']), len(LEGACY)))]
+        if len(found) != 1:
+            raise Exception(str(len(found)) + ' results with ' + str(params) +
+                            ('' if not found else ', add more parameters to choose one: ' + str([entry['params'] for entry in found])))
+        path = found[0]['file']
+        if not os.path.isabs(path):
+            path = os.path.join(self.folder, path)
+        return np.load(path, mmap_mode='r')
+
+    def __contains__(self, params):
+        return len(self.matches(params)) > 0
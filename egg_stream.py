@@ -0,0 +1,178 @@
+"""
+Streaming version of the PE and SPE measures of egg_utils_2, for EEG that arrives in pieces
+instead of a fully loaded recording.
+
+An `eeg_stream` object receives chunks of (64, k) samples and, for each chunk, gives back
+the SPE of every new time sample (horizontal and vertical words of one of the MONTAGES
+grids, the same layouts as eeg.create_data_struc*) and the PE of every channel over the
+last `pe_window` samples. Only the last (L-1)*lag samples and the codes of the current PE
+window are kept, so memory does not grow with the length of the recording.
+
+To test the throughput, the recordings can be replayed from the edf files at 160 Hz or
+faster than real time, directly or through a local socket:
+
+    python egg_stream.py files-2/S001/S001R01.edf --chunk 16 --speed 0 --socket
+"""
+
+import math
+import time
+import socket
+import argparse
+import threading
+import numpy as np
+import mne
+from egg_utils_2 import compile_montage, spatial_counts, entropy_batch, perm_indices_batch
+
+
+class eeg_stream:
+
+    def __init__(self, L=3, lag=1, montage='64', pe_window=320, channels=64):
+        self.L = L
+        self.lag = lag
+        self.montage = montage
+        self.pe_window = pe_window  # samples in the PE window (2 s at 160 Hz)
+        self.channels = channels
+        # spatial words of the montage for each direction, as in eeg.set_mode
+        self.words = {'horizontal': compile_montage(montage, L, 1, lag),
+                      'vertical': compile_montage(montage, 1, L, lag)}
+        self.n = pe_window - (L - 1)*lag  # patterns in the PE window
+        if self.n < 1:
+            raise Exception('pe_window of ' + str(pe_window) + ' samples is too short, it needs more than (L-1)*lag = '
+                            + str((L - 1)*lag) + ' samples')
+        c = np.arange(self.n + 1)
+        self.xlogx = c*np.log(np.where(c > 0, c, 1))
+        self.reset()
+
+    def reset(self):
+        # Forgets everything received so far
+        self.samples = 0  # samples received
+        self.tail = np.zeros((self.channels, 0))  # last (L-1)*lag samples, to build the patterns across chunks
+        self.ring = np.zeros((self.channels, self.n), dtype=int)  # codes of the PE window
+        self.filled = 0  # codes in the ring (up to n)
+        self.position = 0  # where the next code goes in the ring
+        self.counts = np.zeros((self.channels, math.factorial(self.L)), dtype=int)
+        self.S = np.zeros(self.channels)  # sum of c*log(c) of the histograms
+
+    def spatial(self, chunk, direction):
+        # SPE of every time sample of the chunk (does not depend on previous chunks)
+        return entropy_batch(spatial_counts(chunk, self.words[direction], self.L))
+
+    def add_codes(self, codes):
+        # Moves the PE window over the new codes (channels, k), one sample at a time
+        rows = np.arange(self.channels)
+        xlogx = self.xlogx
+        for k in range(codes.shape[1]):
+            entering = codes[:, k]
+            if self.filled == self.n:
+                leaving = self.ring[:, self.position]
+                c_out = self.counts[rows, leaving]
+                self.S += xlogx[c_out - 1] - xlogx[c_out]
+                self.counts[rows, leaving] = c_out - 1
+            else:
+                self.filled += 1
+            c_in = self.counts[rows, entering]
+            self.S += xlogx[c_in + 1] - xlogx[c_in]
+            self.counts[rows, entering] = c_in + 1
+            self.ring[:, self.position] = entering
+            self.position = (self.position + 1) % self.n
+
+    def pe(self):
+        # Normalized PE of every channel over the current window (None until the window is full)
+        if self.filled < self.n:
+            return None
+        return (np.log(self.n) - self.S/self.n)/np.log(math.factorial(self.L))
+
+    def push(self, chunk):
+        # Processes a (channels, k) chunk and returns the updates: the SPE of each new sample
+        # for both directions, the PE of each channel after the chunk and the index of the
+        # first sample of the chunk
+        chunk = np.asarray(chunk, dtype=float)
+        update = {'start': self.samples,
+                  'spe_horizontal': self.spatial(chunk, 'horizontal'),
+                  'spe_vertical': self.spatial(chunk, 'vertical')}
+        extended = np.concatenate([self.tail, chunk], axis=1)
+        span = (self.L - 1)*self.lag
+        if extended.shape[1] > span:
+            self.add_codes(perm_indices_batch(extended, self.L, self.lag) - 1)
+        self.tail = extended[:, extended.shape[1] - span:] if span else extended[:, :0]
+        self.samples += chunk.shape[1]
+        update['pe'] = self.pe()
+        return update
+
+
+def replay_edf(path, chunk=16, speed=1.0):
+    # Yields the recording in (64, chunk) pieces. With speed=1 they come at the real rate of
+    # the recording (160 Hz), speed=2 twice as fast, and speed=0 or None as fast as possible
+    raw = mne.io.read_raw_edf(path, verbose=None)
+    data = raw.get_data()
+    sfreq = raw.info['sfreq']
+    start = time.perf_counter()
+    for first in range(0, data.shape[1], chunk):
+        if speed:
+            wait = start + first/(sfreq*speed) - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        yield data[:, first:first + chunk]
+
+
+def send_chunks(sock, chunks):
+    # Writes the chunks to a socket as float64 samples (channel after channel of each time sample)
+    for piece in chunks:
+        sock.sendall(np.ascontiguousarray(piece.T, dtype='<f8').tobytes())
+    sock.shutdown(socket.SHUT_WR)
+
+
+def socket_chunks(sock, chunk=16, channels=64):
+    # Reads the samples written by send_chunks and yields them as (channels, chunk) pieces
+    size = chunk*channels*8
+    frame = channels*8
+    buffer = b''
+    while True:
+        received = sock.recv(1 << 16)
+        buffer += received
+        # whole chunks while data keeps coming, whatever is left at the end
+        end = len(buffer) - len(buffer) % size if received else len(buffer) - len(buffer) % frame
+        for first in range(0, end, size):
+            piece = buffer[first:min(first + size, end)]
+            yield np.frombuffer(piece, dtype='<f8').reshape(-1, channels).T
+        buffer = buffer[end:]
+        if not received:
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay an edf file through the streaming PE/SPE processor')
+    parser.add_argument('edf')
+    parser.add_argument('--chunk', type=int, default=16, help='samples per chunk')
+    parser.add_argument('--speed', type=float, default=1.0, help='1 = real time, 0 = as fast as possible')
+    parser.add_argument('--L', type=int, default=3)
+    parser.add_argument('--lag', type=int, default=1)
+    parser.add_argument('--montage', default='64')
+    parser.add_argument('--socket', action='store_true', help='send the samples through a local socket')
+    args = parser.parse_args()
+
+    stream = eeg_stream(args.L, args.lag, args.montage)
+    chunks = replay_edf(args.edf, args.chunk, args.speed)
+    if args.socket:
+        sender, receiver = socket.socketpair()
+        threading.Thread(target=send_chunks, args=(sender, chunks), daemon=True).start()
+        chunks = socket_chunks(receiver, args.chunk)
+
+    latencies = []
+    start = time.perf_counter()
+    for piece in chunks:
+        t = time.perf_counter()
+        update = stream.push(piece)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+
+    print('Samples processed:', stream.samples)
+    print('Throughput: %.0f samples/s (%.1f x real time at 160 Hz)' % (stream.samples/elapsed, stream.samples/elapsed/160))
+    print('Processing time per chunk: mean %.2f ms, max %.2f ms' % (1e3*np.mean(latencies), 1e3*np.max(latencies)))
+    print('Last SPE (horizontal, vertical):', update['spe_horizontal'][-1], update['spe_vertical'][-1])
+    if update['pe'] is not None:
+        print('Mean PE of the last window:', np.mean(update['pe']))
+
+
+if __name__ == '__main__':
+    main()
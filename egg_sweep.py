@@ -0,0 +1,206 @@
+"""
+This script computes all the files of eeg_processed/ that make_figs.m reads, for every
+combination of parameters of a grid (word length L, lag, run, raw/filt, montage), instead of
+editing and running one analysis script for each combination.
+
+The grid is declared in GRID below. For each run every edf file is read only once: the raw
+signal and the filtered one are loaded together as the bands of a 'bank' load, and each one is
+put in shared memory (eeg.share_data). All the (subject, configuration) tasks go to the same
+process pool, which is created once for the whole sweep, and each task computes every output
+of its subject (horizontal and vertical SPE, pooled SPE, PE...) from the same encoding.
+
+Files written (one value per subject, or per time sample for the ensemble ones):
+    spe_hor, spe_ver           mean over time of the SPE of each subject
+    std_spe_hor, std_spe_ver   std over time of the SPE of each subject
+    pspe_hor, pspe_ver         pooled SPE (symbols of all the times together) of each subject
+    pe, pe_std                 mean and std over the channels of the PE of each subject
+    ppe                        pooled PE (symbols of all the channels together) of each subject
+    spe_boa                    mean SPE with the best linear arrangement of Boaretto et al. (2023)
+    ensemble_linear, ensemble_best, ensemble_hor, ensemble_ver
+                               mean over subjects of the SPE at every time sample, for the
+                               electrodes in a line (in the order of the files or in the best
+                               order of Boaretto et al.) and for the horizontal/vertical words
+named <output>_L_<L>_lag_<lag>_run_<run>_<mode>.csv (plus _montage_<name> if it is not '64').
+
+Every finished (subject, run, configuration) is also saved in GRID['checkpoints'] (see
+egg_checkpoint.py), so a sweep that is stopped continues where it was, and a run whose
+results are all there is not even loaded.
+"""
+
+import os
+import itertools
+import numpy as np
+import multiprocess as mp
+from datetime import datetime
+from egg_utils_2 import eeg, entropy_batch, perm_indices_batch, pattern_counts
+from egg_checkpoint import checkpoint
+
+# 1. Parameters of the sweep
+
+SUBJECT_OUTPUTS = ('spe_hor', 'spe_ver', 'std_spe_hor', 'std_spe_ver', 'pspe_hor', 'pspe_ver',
+                   'pe', 'pe_std', 'ppe', 'spe_boa')
+ENSEMBLE_OUTPUTS = ('ensemble_linear', 'ensemble_best', 'ensemble_hor', 'ensemble_ver')
+MODE_BANDS = {'raw': None, 'filt': (8, 12)}  # 'filt' is the alpha band
+
+GRID = {
+    'subjects': 108,  # subject 109 is left out (not valid values at the end)
+    'L': [3, 4],
+    'lag': [1, 2],
+    'run': [1, 2],  # 1 = Eyes Open, 2 = Eyes Closed
+    'mode': ['raw', 'filt'],
+    'montage': ['64'],
+    'outputs': list(SUBJECT_OUTPUTS + ENSEMBLE_OUTPUTS),
+    'file_path': '/Users/natalialopezlopezicloud.com/Desktop/Escritorio2/GAIA/eeg-spatial-analysis-main/files-2',
+    'cache_dir': None,  # folder for the decoded signals (see eeg.cache_dir)
+    'folder': 'eeg_processed',
+    'checkpoints': 'checkpoints/sweep',  # None to not save the partial results
+}
+
+
+# 2. Helpers
+
+def configurations(grid):
+    # (L, lag, montage) combinations of the grid
+    return list(itertools.product(grid['L'], grid['lag'], grid['montage']))
+
+
+def csv_name(grid, output, L, lag, run, mode, montage):
+    # Name of the file that make_figs.m reads for this output and parameters
+    name = output + '_L_' + str(L) + '_lag_' + str(lag) + '_run_' + str(run) + '_' + mode
+    if montage != '64':
+        name += '_montage_' + montage
+    return os.path.join(grid['folder'], name + '.csv')
+
+
+def sweep_parameters(grid):
+    # Parameters that change the results of a unit apart from the ones in its name (the
+    # checkpoints of a different data folder, band or list of outputs are not reused)
+    return {'file_path': grid['file_path'], 'max_time': eeg(1, 'raw', 1).max_time,
+            'bands': {mode: MODE_BANDS[mode] for mode in grid['mode']}, 'outputs': sorted(grid['outputs'])}
+
+
+def sweep_unit(j, run, mode, L, lag, montage):
+    # Unit of work of the checkpoints, saved as S<subject>_run_<run>_<mode>_L_<L>_lag_<lag>_montage_<montage>
+    return (j, run, mode, 'L_' + str(L), 'lag_' + str(lag), 'montage_' + montage)
+
+
+def load_run(grid, run):
+    # Reads every subject of the run once, all the modes as bands of a bank, and gives back one
+    # eeg object per mode with its signals in shared memory
+    for mode in grid['mode']:
+        if mode not in MODE_BANDS:
+            raise Exception("Mode not valid for the sweep, it has to be one of " + str(list(MODE_BANDS)))
+    loader = eeg(grid['subjects'], 'bank', run)
+    loader.file_path = grid['file_path']
+    loader.cache_dir = grid['cache_dir']
+    loader.bands = [MODE_BANDS[mode] for mode in grid['mode']]
+    loader.load_data(contiguous=True)
+    conditions = {}
+    for b, mode in enumerate(grid['mode']):
+        eeg_obj = eeg(grid['subjects'], mode, run)
+        eeg_obj.file_path = grid['file_path']
+        eeg_obj.data = loader.bank[:, b]
+        eeg_obj.share_data()
+        conditions[mode] = eeg_obj
+    return conditions
+
+
+# 3. Everything of one subject for one configuration
+
+def subject_values(eeg_obj, j, L, lag, montage, outputs):
+    eeg_obj.L = L
+    eeg_obj.lag = lag
+    values = {}
+    for direction, short in [('horizontal', 'hor'), ('vertical', 'ver')]:
+        if not {'spe_' + short, 'std_spe_' + short, 'pspe_' + short, 'ensemble_' + short} & set(outputs):
+            continue
+        eeg_obj.set_mode(direction)
+        counts = eeg_obj.spatial_counts(j, montage)  # (time, L!)
+        Ht = entropy_batch(counts)
+        values['spe_' + short] = np.mean(Ht)
+        values['std_spe_' + short] = np.std(Ht)
+        values['pspe_' + short] = entropy_batch(counts.sum(axis=0))
+        values['ensemble_' + short] = Ht
+    if {'pe', 'pe_std', 'ppe'} & set(outputs):
+        # one encoding for the PE of each channel and the pooled PE
+        counts = pattern_counts(perm_indices_batch(eeg_obj.data[j][:64, :eeg_obj.max_time], L, lag), L)
+        pe = entropy_batch(counts)
+        values['pe'] = np.mean(pe)
+        values['pe_std'] = np.std(pe)
+        values['ppe'] = entropy_batch(counts.sum(axis=0))
+    if 'ensemble_linear' in outputs:
+        values['ensemble_linear'] = eeg_obj.linear_series(j)
+    if {'spe_boa', 'ensemble_best'} & set(outputs):
+        Ht = eeg_obj.linear_series(j, 'best')
+        values['spe_boa'] = np.mean(Ht)  # same as eeg_obj.par_spatial_boaretto(j)
+        values['ensemble_best'] = Ht
+    return {output: values[output] for output in outputs}
+
+
+def subject_task(task):
+    eeg_obj, j, L, lag, montage, outputs, ckpt = task
+    if ckpt is None:
+        values = subject_values(eeg_obj, j, L, lag, montage, outputs)
+    else:
+        unit = sweep_unit(j, eeg_obj.run, eeg_obj.mode, L, lag, montage)
+        values = ckpt.compute(unit, subject_values, eeg_obj, j, L, lag, montage, outputs)
+    return eeg_obj.mode, L, lag, montage, j, values
+
+
+# 4. The sweep
+
+def run_sweep(grid, processes=None):
+    os.makedirs(grid['folder'], exist_ok=True)
+    outputs = list(grid['outputs'])
+    subject_outputs = [output for output in outputs if output in SUBJECT_OUTPUTS]
+    ensemble_outputs = [output for output in outputs if output in ENSEMBLE_OUTPUTS]
+    ckpt = checkpoint(grid['checkpoints'], **sweep_parameters(grid)) if grid['checkpoints'] else None
+    written = []
+    with mp.Pool(processes or mp.cpu_count()) as pool:
+        for run in grid['run']:
+            startTime = datetime.now()
+            units = [(mode, L, lag, montage, j) for mode in grid['mode']
+                     for L, lag, montage in configurations(grid)
+                     for j in range(grid['subjects'])]
+            done = [] if ckpt is None else [unit for unit in units if ckpt.done(sweep_unit(unit[4], run, *unit[:4]))]
+            # the results already in the checkpoints are read here, the rest go to the pool
+            finished = (unit + (ckpt.load(sweep_unit(unit[4], run, *unit[:4])),) for unit in done)
+            done_set = set(done)
+            missing = [unit for unit in units if unit not in done_set]
+            conditions = {}
+            if missing:
+                conditions = load_run(grid, run)
+                print('Run', run, 'loaded:', str(datetime.now() - startTime), ',', len(done), 'of', len(units), 'units from the checkpoints')
+            tasks = [(conditions[mode], j, L, lag, montage, outputs, ckpt) for mode, L, lag, montage, j in missing]
+
+            per_subject = {}  # (mode, L, lag, montage) -> output -> value of each subject
+            # (mode, L, lag, montage) -> output -> sum over subjects at every time. Each series is
+            # added as soon as its subject is finished, so they are never all in memory
+            ensemble = {}
+            for mode, L, lag, montage, j, values in itertools.chain(finished, pool.imap_unordered(subject_task, tasks)):
+                key = (mode, L, lag, montage)
+                table = per_subject.setdefault(key, {output: np.full(grid['subjects'], np.nan) for output in subject_outputs})
+                for output in subject_outputs:
+                    table[output][j] = values[output]
+                sums = ensemble.setdefault(key, {})
+                for output in ensemble_outputs:
+                    sums[output] = sums.get(output, 0) + values[output]
+
+            for eeg_obj in conditions.values():
+                eeg_obj.release_data()
+            for (mode, L, lag, montage), table in per_subject.items():
+                for output in subject_outputs:
+                    written.append(csv_name(grid, output, L, lag, run, mode, montage))
+                    np.savetxt(written[-1], table[output], delimiter=',')
+                for output in ensemble_outputs:
+                    written.append(csv_name(grid, output, L, lag, run, mode, montage))
+                    np.savetxt(written[-1], ensemble[(mode, L, lag, montage)][output]/grid['subjects'], delimiter=',')
+            print('Run', run, 'done:', str(datetime.now() - startTime))
+    return written
+
+
+if __name__ == '__main__':
+    startTime = datetime.now()
+    files = run_sweep(GRID)
+    print(len(files), 'files written in', GRID['folder'])
+    print('Time elapsed:', str(datetime.now() - startTime))
@@ -6,10 +6,11 @@ Spatial Permutation Entropy (SPE).
 
 Key functionalities:
 --------------------
-- Load EEG signals from .edf files using MNE (raw, filtered, or with notch filtering).
+- Load EEG signals from .edf files using MNE (raw, filtered, with notch filtering, or a bank of several bands at once).
 - Reorganize electrode data into spatial grids (64, 31, or 17 channels) to apply spatial analysis.
+- Keep the grid layouts in a small registry (MONTAGES), new layouts can be loaded from a text file.
 - Compute different variants of Spatial Permutation Entropy (SPE), including pooled and time-resolved versions.
-- Calculate basic statistical features per channel (mean, variance, skewness, kurtosis, MAD, IQR, autocorrelation, etc).
+- Calculate basic statistical features per channel (mean, variance, skewness, kurtosis, MAD, IQR, autocorrelation, decorrelation time, etc).
 - Contains helper functions for calculating ordinal patterns and entropy values.
 
 Usage:
@@ -25,17 +26,126 @@ The EEG data comes from the PhysioNet dataset. Each subject has recordings in tw
 
 """
 
+import os
+import sys
+import time
+import hashlib
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
 import mne
 import math
 import numpy as np
-from scipy.stats import skew, kurtosis # important to do the skwness and kurtosis
+from numpy.lib.stride_tricks import sliding_window_view
+import scipy.fft
+import scipy.signal
+
+
+# Preprocessing options of eeg.load_data
+LOAD_MODES = ('raw','filt','notch','bank')
+
+# Per-channel statistics available in eeg.extract_features. Besides these, 'autocorr_<k>'
+# gives the autocorrelation at lag k (e.g. 'autocorr_5')
+FEATURES = ('mean','variance','mad','iqr','skewness','kurtosis','autocorr','decorrelation')
+
+
+# Electrode arrangements of the ensemble analysis (eeg.ensemble_SPE)
+ARRANGEMENTS = ('linear','best','horizontal','vertical')
+
+# Best linear order of the channels (numbers 1 to 64) of Boaretto et al. (2023), see eeg.boaretto_best
+BOARETTO_ORDER = np.array([22,23,24,25,26,27,28,29,30,31,32,33,34,35,36,37,38,39,
+                           1,2,3,4,5,6,7,40,43,41,8,9,10,11,12,13,14,42,44,45,15,
+                           16,17,18,19,20,21,46,47,48,49,50,51,52,53,54,55,56,57,
+                           58,59,60,61,62,63,64])
+
+# Grid layouts for the spatial analysis. Each row lists the channel numbers (1 to 64, the
+# order of the edf files) from left to right and the rows are centred in the grid.
+# '64' is the arrangement of Gancio et al. (2024), '31' and '17' are the reduced montages.
+MONTAGES = {
+    '64': [[22,23,24],[25,26,27,28,29],[30,31,32,33,34,35,36,37,38],
+           [39,1,2,3,4,5,6,7,40],[43,41,8,9,10,11,12,13,14,42,44],
+           [45,15,16,17,18,19,20,21,46],[47,48,49,50,51,52,53,54,55],
+           [56,57,58,59,60],[61,62,63],[64]],
+    '31': [[22,23,24],[30,32,34,36,38],[39,2,4,6,40],[43,9,11,13,44],
+           [45,16,18,20,46],[56,49,51,53,55],[61,62,63]],
+    '17': [[22,23,24],[32,34,36],[41,9,11,13,42],[49,51,53],[61,62,63]],
+}
+
+_grids = {} #name -> (grid shape, flat grid positions, channel indices)
+_word_tables = {} #(name, Lx, Ly, lag) -> channel indices of the valid words
+
+
+def register_montage(name,rows):
+    # Adds a new layout to MONTAGES (rows of channel numbers, as in the built-in ones)
+    MONTAGES[name]=[[int(ch) for ch in row] for row in rows]
+    _grids.pop(name,None)
+    for key in [k for k in _word_tables if k[0]==name]:
+        del _word_tables[key]
+    return name
+
+def load_montage(path,name=None):
+    # Reads a layout from a text file with one grid row per line, written as the channel
+    # numbers separated by spaces or commas. Lines starting with # are ignored.
+    # The montage is registered with the file name (without extension) unless name is given
+    rows=[]
+    with open(path) as f:
+        for line in f:
+            line=line.split('#')[0].replace(',',' ').split()
+            if line:
+                rows.append(line)
+    if name is None:
+        name=os.path.splitext(os.path.basename(path))[0]
+    return register_montage(name,rows)
+
+def montage_grid(name):
+    # Gather indices of a montage: grid shape, flat position of each electrode in the grid
+    # and its channel index. Computed once, with the same centring as create_data_struc
+    if name not in _grids:
+        rows=MONTAGES[name]
+        row_len=[len(row) for row in rows]
+        mid=(max(row_len)-1)/2-1
+        positions=[]
+        for j in range(len(rows)):
+            for i in range(row_len[j]):
+                positions.append(j*max(row_len)+int(mid-(row_len[j]-1)/2+i+1))
+        channels=np.array([ch-1 for row in rows for ch in row])
+        _grids[name]=((len(rows),max(row_len)),np.array(positions),channels)
+    return _grids[name]
+
+def build_grid(data,name):
+    # Places the channels of data (one value per channel) in the grid of the montage,
+    # the cells without electrode are NaN
+    shape,positions,channels=montage_grid(name)
+    grid=np.full(shape[0]*shape[1],math.nan)
+    grid[positions]=np.asarray(data)[channels]
+    return grid.reshape(shape)
+
+def compile_montage(name,Lx,Ly,lag):
+    # Channel indices of all the valid spatial words of the montage, shape (words, L).
+    # The grid is built once with the channel numbers instead of the signal, so the words
+    # come out in the same order as in eeg.spatial_code
+    key=(name,Lx,Ly,lag)
+    if key not in _word_tables:
+        grid=build_grid(np.arange(64,dtype=float),name)
+        words=[]
+        for j in range(grid.shape[0]-(Ly-1)*lag):
+            for i in range(grid.shape[1]-(Lx-1)*lag):
+                word=grid[j+np.arange(Ly)*lag,i+np.arange(Lx)*lag]
+                if not(np.isnan(word).any()):
+                    words.append(word.astype(int))
+        if not words:
+            raise Exception("The montage "+str(name)+" has no spatial words with Lx="+str(Lx)+", Ly="+str(Ly)+" and lag="+str(lag))
+        _word_tables[key]=np.array(words,dtype=int).reshape(-1,max(Lx,Ly))
+    return _word_tables[key]
+
 
 
 class eeg:
 
     def __init__(self,subjects,mode,run):
         self.subjects = subjects #number of subjects
-        self.mode=mode #raw or filt
+        self.mode=mode #'raw', 'filt', 'notch' or 'bank' (several bands at once, see self.bands)
         self.run=run #number of experiment: 1 corresponds to Eyes Open, and 2 to Eyes Closed
         #self.max_time=9600 #maximum time fo the experiment
         self.max_time= 9440
@@ -50,123 +160,274 @@ class eeg:
 
         self.cut_low = []
         self.cut_up = []
+        self.bands=[None,(8,12),(12,30)] #(cut_low, cut_up) of each band in 'bank' mode, None = raw signal
+        self.bank=[]
+        self.band=0
+        self.filter_method='fir' #'fir' (same design as mne.filter.filter_data) or 'iir' (Butterworth, sosfiltfilt)
+        self.iir_order=4
+        self.filter_times={} #subject -> seconds spent filtering
         self.raw=[]
-
-    def load_data(self):
-        R=self.run
-        self.data=[]
-        if self.mode=='raw':
-            for subject_number in range(self.subjects):
-                   
-                if subject_number>=99:
-                    name=self.file_path+"/S"+str(subject_number+1)+"/S"+str(subject_number+1)+"R0"+str(R)+".edf"
-                elif subject_number>=9:
-                    name=self.file_path+"/S0"+str(subject_number+1)+"/S0"+str(subject_number+1)+"R0"+str(R)+".edf"
-                else:
-                    name=self.file_path+"/S00"+str(subject_number+1)+"/S00"+str(subject_number+1)+"R0"+str(R)+".edf"
-                raw = mne.io.read_raw_edf(name,verbose=None)
-
-                self.raw = raw
-                self.data=self.data+[raw.get_data()]
-    
-
-        elif self.mode=='filt':
-            for subject_number in range(self.subjects):
-                        
-                '''if subject_number == 96:
-                  
-                    continue '''
-                if subject_number>=99:
-                    name=self.file_path+"/S"+str(subject_number+1)+"/S"+str(subject_number+1)+"R0"+str(R)+".edf"
-                elif subject_number>=9:
-                    name=self.file_path+"/S0"+str(subject_number+1)+"/S0"+str(subject_number+1)+"R0"+str(R)+".edf"
-                else:
-                    name=self.file_path+"/S00"+str(subject_number+1)+"/S00"+str(subject_number+1)+"R0"+str(R)+".edf"
-                raw = mne.io.read_raw_edf(name,verbose=None)
-
-                self.data=self.data+[mne.filter.filter_data(data=raw.get_data(), sfreq=160, l_freq= self.cut_low, h_freq= self.cut_up)]
-        
-        elif self.mode=='notch':
-            freqs = self.cut_low - ((self.cut_low - self.cut_up)/2)
-            ancho = -(self.cut_low - self.cut_up)
-
-            for subject_number in range(self.subjects):
-                        
-                '''if subject_number == 96
-                  
-                    continue '''
-                if subject_number>=99:
-                    name=self.file_path+"/S"+str(subject_number+1)+"/S"+str(subject_number+1)+"R0"+str(R)+".edf"
-                elif subject_number>=9:
-                    name=self.file_path+"/S0"+str(subject_number+1)+"/S0"+str(subject_number+1)+"R0"+str(R)+".edf"
-                else:
-                    name=self.file_path+"/S00"+str(subject_number+1)+"/S00"+str(subject_number+1)+"R0"+str(R)+".edf"
-                raw = mne.io.read_raw_edf(name,verbose=None)
-
-                self.data=self.data+[mne.filter.notch_filter(raw.get_data(), 160, freqs= freqs, notch_widths= ancho )]
-        
-
+        self.workers=os.cpu_count() or 1 #threads used to read the edf files
+        self.shared=None #description of the shared data block, set by share_data
+        self._shm=None
+        self.cache_dir=None #folder for the decoded signals (None = always read the edf files)
+        self.montage='64' #grid layout used by spatial_series, any key of MONTAGES
+
+    def load_data(self,contiguous=False):
+        # Loads all the subjects in self.data, reading them with a pool of self.workers threads.
+        # By default self.data is a list with one (64, time) array per subject. With
+        # contiguous=True it is a single (subjects, 64, max_time) array filled in place.
+        # In 'bank' mode every subject has all the bands of self.bands, (bands, 64, time),
+        # kept in self.bank, and self.data shows the band chosen with select_band
+        if self.mode not in LOAD_MODES:
+            raise Exception("Load mode not specified or incorrect, Mode has to be one of "+str(LOAD_MODES))
+        if contiguous:
+            if self.mode=='bank':
+                data=np.empty((self.subjects,len(self.bands),64,self.max_time))
+            else:
+                data=np.empty((self.subjects,64,self.max_time))
+            for subject_number,signal in self.iter_subjects():
+                data[subject_number]=signal[...,:64,:self.max_time]
         else:
-            raise Exception("Load mode not specified or incorrect, Mode has to be 'raw' or 'filt'")
+            data=[None]*self.subjects
+            for subject_number,signal in self.iter_subjects():
+                data[subject_number]=signal
+        if self.mode=='bank':
+            self.bank=data
+            self.select_band(0)
+        else:
+            self.data=data
             
         '''if self.subjects>=96:
              self.subjects=self.subjects-1
              
              print('Subjects number changed to: '+str(self.subjects))'''
         
+    def select_band(self,band):
+        # Makes self.data show band number `band` of self.bands (only in 'bank' mode). No data
+        # is copied, so all the PE/SPE methods can be run band after band on the same load
+        self.band=band
+        if isinstance(self.bank,np.ndarray):
+            self.data=self.bank[:,band]
+        else:
+            self.data=[signal[band] for signal in self.bank]
+    
+    def band_view(self,j):
+        # All the bands of subject j, (bands, 64, time) (only in 'bank' mode)
+        return self.bank[j]
+    
+    def share_data(self,path=None):
+        # Puts the loaded signals in one (subjects, 64, max_time) block in shared memory, or in
+        # a memory-mapped .npy file when path is given, and makes self.data a view of it.
+        # After this, pickling the object (as pool.map does with eeg.par_spatial) only sends
+        # the name of the block, and every worker maps the same copy of the data.
+        # In 'bank' mode the whole (subjects, bands, 64, max_time) bank is shared and self.data
+        # is the band chosen with select_band, in the workers too
+        if self.mode=='bank':
+            if isinstance(self.bank,np.ndarray) and self.bank.ndim==4:
+                block=self.bank
+            else:
+                block=np.stack([np.asarray(b)[:,:64,:self.max_time] for b in self.bank])
+        elif isinstance(self.data,np.ndarray) and self.data.ndim==3:
+            block=self.data
+        else:
+            block=np.stack([np.asarray(d)[:64,:self.max_time] for d in self.data])
+        if path is None:
+            shm=shared_memory.SharedMemory(create=True,size=block.nbytes)
+            shared=np.ndarray(block.shape,dtype=block.dtype,buffer=shm.buf)
+            shared[:]=block
+            self._shm=shm
+            self.shared=('shm',shm.name,block.shape,block.dtype.str)
+        else:
+            shared=np.lib.format.open_memmap(path,mode='w+',dtype=block.dtype,shape=block.shape)
+            shared[:]=block
+            shared.flush()
+            self.shared=('file',path,block.shape,block.dtype.str)
+        self.set_block(shared)
+        return self.shared
+    
+    def set_block(self,block):
+        # Uses block as the data (or as the bank of all the bands in 'bank' mode)
+        if self.mode=='bank':
+            self.bank=block
+            self.select_band(self.band)
+        else:
+            self.data=block
+    
+    def release_data(self):
+        # Copies the data back to normal memory and frees the shared block.
+        # Call it from the main process once the pools are finished
+        if self.shared is None:
+            return
+        self.set_block(np.array(self.bank if self.mode=='bank' else self.data))
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm=None
+        self.shared=None
+    
+    def attach_data(self):
+        # Maps the block described in self.shared (used when the object is unpickled in a worker)
+        kind,name,shape,dtype=self.shared
+        if kind=='shm':
+            # Only the owner keeps track of the block (and unlinks it). Attaching also registers
+            # it in the resource tracker of the worker, which with the multiprocess pools (or the
+            # spawn start method) is a different one and would remove the block when the worker
+            # exits. From Python 3.13 the block can be opened without tracking it; before, the
+            # registration is taken back, unless the tracker is the owner's one (fork), which
+            # has to keep it
+            if sys.version_info>=(3,13):
+                shm=shared_memory.SharedMemory(name=name,track=False)
+            else:
+                own_tracker=getattr(resource_tracker._resource_tracker,'_fd',None) is None
+                shm=shared_memory.SharedMemory(name=name)
+                if own_tracker:
+                    resource_tracker.unregister(shm._name,'shared_memory')
+            self._shm=None
+            self._attached=shm
+            self.set_block(np.ndarray(shape,dtype=np.dtype(dtype),buffer=shm.buf))
+        else:
+            self.set_block(np.load(name,mmap_mode='r'))
+    
+    def __getstate__(self):
+        state=self.__dict__.copy()
+        state.pop('_shm',None)
+        state.pop('_attached',None)
+        if state.get('shared') is not None:
+            # the workers map the shared block again, the signals are not sent
+            state.pop('data',None)
+            state.pop('bank',None)
+        return state
+    
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._shm=None
+        if self.shared is not None:
+            self.attach_data()
+    
+    def iter_subjects(self,subjects=None):
+        # Generator of (subject_number, signal) in order, for code that only needs one subject
+        # at a time. The next subjects are read in the background by self.workers threads
+        # (reading and filtering run mostly outside the GIL), at most 2*workers ahead
+        if subjects is None:
+            subjects=range(self.subjects)
+        subjects=iter(subjects)
+        workers=max(1,self.workers)
+        pending=deque()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for subject_number in itertools.islice(subjects,2*workers):
+                pending.append((subject_number,pool.submit(self.read_subject,subject_number)))
+            while pending:
+                subject_number,future=pending.popleft()
+                for following in itertools.islice(subjects,1):
+                    pending.append((following,pool.submit(self.read_subject,following)))
+                yield subject_number,future.result()
+    
+    def edf_name(self,subject_number):
+        # Path of the edf file of subject_number (starting at 0) for the current run
+        S="S"+str(subject_number+1).zfill(3)
+        return self.file_path+"/"+S+"/"+S+"R0"+str(self.run)+".edf"
+    
+    def filter(self,data,cut_low,cut_up,subject_number=None):
+        # Band-pass of all the channels with the filter design of self.filter_method, designed
+        # only once for each band. The time spent is added to self.filter_times[subject_number]
+        start=time.perf_counter()
+        filtered=apply_filter(data,160,cut_low,cut_up,self.filter_method,self.iir_order)
+        if subject_number is not None:
+            self.filter_times[subject_number]=self.filter_times.get(subject_number,0)+time.perf_counter()-start
+        return filtered
+    
+    def filter_report(self):
+        # Prints and returns the filtering time of every subject (seconds)
+        times=np.array([self.filter_times[k] for k in sorted(self.filter_times)])
+        if len(times):
+            print('Filtering ('+self.filter_method+'): '+str(len(times))+' subjects, mean '+
+                  str(round(1e3*times.mean(),2))+' ms, max '+str(round(1e3*times.max(),2))+' ms, total '+str(round(times.sum(),2))+' s')
+        return dict(self.filter_times)
+    
+    def decode(self,raw,subject_number=None):
+        # Signal of one recording, (64, time), with the preprocessing given by self.mode
+        if self.mode=='raw':
+            return raw.get_data()
+        elif self.mode=='filt':
+            return self.filter(raw.get_data(),self.cut_low,self.cut_up,subject_number)
+        elif self.mode=='notch':
+            freqs = self.cut_low - ((self.cut_low - self.cut_up)/2)
+            ancho = -(self.cut_low - self.cut_up)
+            return mne.filter.notch_filter(raw.get_data(), 160, freqs= freqs, notch_widths= ancho )
+        elif self.mode=='bank':
+            # the recording is decoded once and each band is filtered on the 64 channels at once
+            data=raw.get_data()
+            bank=np.empty((len(self.bands),)+data.shape)
+            for b,band in enumerate(self.bands):
+                if band is None:
+                    bank[b]=data
+                else:
+                    bank[b]=self.filter(data,band[0],band[1],subject_number)
+            return bank
+        else:
+            raise Exception("Load mode not specified or incorrect, Mode has to be one of "+str(LOAD_MODES))
+    
+    def decode_parameters(self):
+        # Parameters that change the signal given by decode in the current mode (the raw signal
+        # does not depend on the filter settings, so they are not part of its cache key)
+        if self.mode=='raw':
+            return ()
+        elif self.mode=='notch':
+            return (self.cut_low,self.cut_up)
+        elif self.mode=='filt':
+            params=(self.cut_low,self.cut_up,self.filter_method)
+        elif self.mode=='bank':
+            params=(self.bands,)
+            if all(band is None for band in self.bands):
+                return params
+            params+=(self.filter_method,)
+        else:
+            raise Exception("Load mode not specified or incorrect, Mode has to be one of "+str(LOAD_MODES))
+        if self.filter_method=='iir':
+            params+=(self.iir_order,)
+        return params
+    
+    def cache_name(self,name):
+        # Cache file of an edf file. The key has the path, size and modification time of the
+        # edf plus the load mode and the parameters of that mode, so any change gives a new file
+        st=os.stat(name)
+        key="|".join(str(k) for k in (os.path.abspath(name),st.st_mtime_ns,st.st_size,self.mode)+self.decode_parameters())
+        digest=hashlib.sha1(key.encode()).hexdigest()[:16]
+        base=os.path.splitext(os.path.basename(name))[0]
+        return os.path.join(self.cache_dir,base+"_"+self.mode+"_"+digest+".npy")
+    
+    def read_subject(self,subject_number):
+        # Reads and decodes one subject. With self.cache_dir set the decoded signal is stored
+        # as a .npy file the first time and opened with mmap the next ones, so the edf is
+        # not parsed again
+        name=self.edf_name(subject_number)
+        if self.cache_dir is None:
+            raw = mne.io.read_raw_edf(name,verbose=None)
+            self.raw = raw
+            return self.decode(raw,subject_number)
+        cached=self.cache_name(name)
+        if not os.path.exists(cached):
+            raw = mne.io.read_raw_edf(name,verbose=None)
+            self.raw = raw
+            os.makedirs(self.cache_dir,exist_ok=True)
+            tmp=cached+"."+str(os.getpid())+".tmp"
+            with open(tmp,'wb') as f:
+                np.save(f,self.decode(raw,subject_number))
+            os.replace(tmp,cached) #the file only appears once it is complete
+        return np.load(cached,mmap_mode='r')
+    
     def create_data_struc(self,data):
         #This function gives the grid arrangement as in 
         #Gancio, J., Masoller, C., & Tirabassi, G. (2024). Permutation entropy analysis of EEG signals for distinguishing eyes-open and eyes-closed brain states: Comparison of different approaches. Chaos: An Interdisciplinary Journal of Nonlinear Science, 34(4).
-        
-        row_len=[3,5,9,9,11,9,9,5,3,1]
-        new_order=[22,23,24,25,26,27,28,29,30,31,32,33,34,35,36,37,38,39,
-                   1,2,3,4,5,6,7,40,43,41,8,9,10,11,12,13,14,42,44,45,15,
-                   16,17,18,19,20,21,46,47,48,49,50,51,52,53,54,55,56,57,
-                   58,59,60,61,62,63,64]
-        
-        new_data=[math.nan]*(len(row_len)*max(row_len))
-        new_data=np.array(new_data).reshape(len(row_len),max(row_len))
-        mid=(max(row_len)-1)/2-1
-        counter=0
-        for j in range(len(row_len)):
-            for i in range(row_len[j]):
-                new_data[j,int(mid-(row_len[j]-1)/2+i+1)]=data[new_order[counter]-1]
-                counter+=1
-        return new_data
+        return build_grid(data,'64')
     
     def create_data_struc_31(self, data):
-        # Esta función organiza 30 electrodos en una rejilla según una disposición definida manualmente.
-        row_len = [3, 5, 5, 5, 5, 5, 3]
-        new_order = [22, 23, 24, 30, 32, 34, 36, 38, 39,
-                    2, 4, 6, 40, 43, 9, 11, 13, 44, 45,
-                    16, 18, 20, 46, 56, 49, 51, 53, 55,
-                    61, 62, 63]
-
-        new_data = [math.nan] * (len(row_len) * max(row_len))
-        new_data = np.array(new_data).reshape(len(row_len), max(row_len))
-        mid = (max(row_len) - 1) / 2 - 1
-        counter = 0
-        for j in range(len(row_len)):
-            for i in range(row_len[j]):
-                new_data[j, int(mid - (row_len[j] - 1) / 2 + i + 1)] = data[new_order[counter] - 1]
-                counter += 1
-        return new_data
+        # Esta función organiza 31 electrodos en una rejilla según la disposición de MONTAGES['31'].
+        return build_grid(data,'31')
     
     def create_data_struc_17(self, data):
-        row_len = [3,3,5,3,3]
-        new_order = [22,23,24,32,34,36,41,9,11,13,42,49,51,53,61,62,63]
-        new_data = [math.nan] * (len(row_len) * max(row_len))
-        new_data = np.array(new_data).reshape(len(row_len), max(row_len))
-        
-        mid = (max(row_len) - 1) / 2 - 1
-        counter = 0
-        
-        for j in range(len(row_len)):
-            for i in range(row_len[j]):
-                col = int(mid - (row_len[j] - 1) / 2 + i + 1)
-                new_data[j, col] = data[new_order[counter] - 1]
-                counter += 1
-        return new_data
+        return build_grid(data,'17')
 
     
 
@@ -194,201 +455,269 @@ class eeg:
              
         return code
     
+    def word_table(self,montage):
+        # Valid spatial words of the montage for the current Lx, Ly and lag
+        return compile_montage(montage,self.Lx,self.Ly,self.lag)
+    
+    def spatial_counts(self,j,montage):
+        # Symbol histogram of the spatial words at every time sample of subject j, shape (time, L!)
+        # The whole recording is gathered into a (time, words, L) tensor and encoded at once
+        return spatial_counts(np.asarray(self.data[j])[:,:self.max_time],self.word_table(montage),self.L)
+    
+    def spatial_series(self,j,montage=None):
+        # Gets the SPE of subject j at every time sample and its mean over time
+        if montage is None:
+            montage=self.montage
+        Ht=entropy_batch(self.spatial_counts(j,montage))
+        return Ht,np.mean(Ht)
+    
+    def par_spatial_montage(self,j):
+        #Gets mean SPE from subject j with the montage in self.montage
+        return self.spatial_series(j)[1]
+    
     def par_spatial(self,j):
         #Gets mean SPE from subject j
-        Ht=[]
-        
-        for t in range(self.max_time):
-            
-            new_data=self.data[j][:,t] #Get channels for time t
-            structured_data=self.create_data_struc(new_data)
-                    
-            code=self.spatial_code(structured_data)
-            
-            probs=probabilities(code,self.L)
-            Ht=Ht+[entropy(probs)/np.log(math.factorial(self.L))]
-        
-        return np.mean(Ht)
+        return self.spatial_series(j,'64')[1]
     
     ########### para el montage de 30 electrodos. 
     def par_spatial_31_elect(self,j):
         #Gets mean SPE from subject j
-        Ht=[]
-        
-        for t in range(self.max_time):
-            
-            new_data=self.data[j][:,t] #Get channels for time t
-            structured_data=self.create_data_struc_31(new_data)
-                    
-            code=self.spatial_code(structured_data)
-            
-            probs=probabilities(code,self.L)
-            Ht=Ht+[entropy(probs)/np.log(math.factorial(self.L))]
-        
-        return np.mean(Ht)
+        return self.spatial_series(j,'31')[1]
     
     
     def par_spatial_17_elect(self,j):
-        #Gets mean SPE from subject j
-        Ht=[]
-        
-        for t in range(self.max_time):
-            new_data=self.data[j][:,t] #Get channels for time t
-            structured_data=self.create_data_struc_17(new_data)
-                    
-            code=self.spatial_code(structured_data)
-    
-            probs=probabilities(code,self.L)
-            Ht=Ht+[entropy(probs)/np.log(math.factorial(self.L))]
-        
-        return Ht
+        #Gets SPE from subject j at every time
+        return list(self.spatial_series(j,'17')[0])
     
-
-
-
     
     def par_pool_SPE(self,j):
         #Gets pooled spatial entropy (PSPE) of subject j
-                    
-        code=[]
-        
-        for t in range(self.max_time):
-            
-            new_data=self.data[j][:,t] #Get channels for time t
-            structured_data=self.create_data_struc_17(new_data)
-            code.extend(self.spatial_code(structured_data))
-        
-        probs=probabilities(code,self.L)
-        
-        return entropy(probs)/np.log(math.factorial(self.L))
+        counts=self.spatial_counts(j,'17').sum(axis=0)
+        return entropy_batch(counts)
 
     
     def par_spatial_2(self,j):
-        #Gets mean SPE from subject j
-        Ht=[]
-        
-        for t in range(self.max_time):
-            
-            new_data=self.data[j][:,t] #Get channels for time t
-            structured_data=self.create_data_struc_312(new_data)
-                    
-            code=self.spatial_code(structured_data)
-            
-            probs=probabilities(code,self.L)
-            Ht=Ht+[entropy(probs)/np.log(math.factorial(self.L))]
-        
-        return Ht
+        #Gets SPE from subject j at every time with the 31 electrodes montage
+        return list(self.spatial_series(j,'31')[0])
     
     def boaretto_best(self,data):
         #This function orders the data according to the best ordering reported in 
         #Boaretto, B. R., Budzinski, R. C., Rossi, K. L., Masoller, C., & Macau, E. E. (2023). Spatial permutation entropy distinguishes resting brain states. Chaos, Solitons & Fractals, 171, 113453.
-        
-        new_order=[22,23,24,25,26,27,28,29,30,31,32,33,34,35,36,37,38,39,
-                   1,2,3,4,5,6,7,40,43,41,8,9,10,11,12,13,14,42,44,45,15,
-                   16,17,18,19,20,21,46,47,48,49,50,51,52,53,54,55,56,57,
-                   58,59,60,61,62,63,64]
-        
-        new_data=[math.nan]*(len(new_order))
-
-        for i in range(len(data)):
-            
-            new_data[i]=data[new_order[i]-1]
-                
-        return new_data
+        #data can be the 64 channels of one time or a whole (64, time) matrix
+        return np.asarray(data)[BOARETTO_ORDER-1]
+    
+    def linear_series(self,j,order=None):
+        #Gets the SPE of subject j at every time with the electrodes in a line: in the order of
+        #the dataset (order=None), in the best order of Boaretto et al. (order='best') or in any
+        #other order given as a list of channel numbers (1 to 64, it can leave channels out).
+        #The channels are reordered with one index and all the times are encoded at once
+        data=np.asarray(self.data[j])[:,:self.max_time]
+        if order is None:
+            data=data[:64]
+        elif isinstance(order,str) and order=='best':
+            data=self.boaretto_best(data[:64])
+        else:
+            order=np.asarray(order,dtype=int)
+            if order.ndim!=1 or order.min()<1 or order.max()>64:
+                raise Exception("The order has to be a list of channel numbers from 1 to 64")
+            if len(order)<(self.L-1)*self.lag+1:
+                raise Exception("The order has less channels than one word of L="+str(self.L)+" and lag="+str(self.lag))
+            data=data[order-1]
+        code=perm_indices(data.T,self.L,self.lag) #(time, words), the words go along the channels
+        return entropy_batch(pattern_counts(code,self.L))
     
     def par_spatial_boaretto(self,j):
         #Gets mean SPE from subject j
-        Ht=[]
-        
-        for t in range(self.max_time):
-            
-            structured_data=self.data[j][:,t] #Get channels for time t
-            structured_data=self.boaretto_best(structured_data)
-                    
-            code=perm_indices(structured_data,self.L,self.lag)
-            
-            probs=probabilities(code,self.L)
-            Ht=Ht+[entropy(probs)/np.log(math.factorial(self.L))]
-        
-        return np.mean(Ht)
+        return np.mean(self.linear_series(j,'best'))
+    
+    def arrangement_series(self,j,arrangement):
+        #Gets the SPE of subject j at every time for one of ARRANGEMENTS: 'linear' and 'best' as
+        #in Boaretto et al. (2023), 'horizontal' and 'vertical' words of the self.montage grid.
+        #A tuple of channel numbers is taken as another linear order (see linear_series)
+        if arrangement=='linear':
+            return self.linear_series(j)
+        elif arrangement=='best':
+            return self.linear_series(j,'best')
+        elif isinstance(arrangement,tuple):
+            return self.linear_series(j,arrangement)
+        elif arrangement in ('horizontal','vertical'):
+            Lx,Ly=self.Lx,self.Ly
+            self.set_mode(arrangement)
+            try:
+                return self.spatial_series(j)[0]
+            finally:
+                self.Lx,self.Ly=Lx,Ly
+        raise Exception("Arrangement not specified or incorrect, it has to be one of "+str(ARRANGEMENTS))
+    
+    def ensemble_SPE(self,arrangements=ARRANGEMENTS,subjects=None):
+        #Ensemble analysis of Boaretto et al. (2023): for every time, the mean SPE over the
+        #subjects, for each arrangement. One pass over the subjects, adding each series to a
+        #running sum, so only one subject's series is in memory at a time.
+        #Returns a dict arrangement -> (max_time,) array
+        if subjects is None:
+            subjects=range(self.subjects)
+        sums={arrangement:np.zeros(self.max_time) for arrangement in arrangements}
+        n=0
+        for j in subjects:
+            for arrangement in arrangements:
+                sums[arrangement]+=self.arrangement_series(j,arrangement)
+            n+=1
+        return {arrangement:sums[arrangement]/n for arrangement in arrangements}
     
     def par_PE(self,j):
         # Gets average usual permutation entropy (PE) of subject j
-        Ht=[]
-        for i in range(64):
-            selected_data=self.data[j][i,:self.max_time] #Get channels i for all times 
-            code=perm_indices(selected_data,self.L,self.lag)
-
-            probs=probabilities(code,self.L)
-            Ht=Ht+[entropy(probs)/np.log(math.factorial(self.L))]
-        return np.mean(Ht)
+        return np.mean(self.PE_chanel(j))
     
     
     def PE_chanel(self,j):
-        # Gets average usual permutation entropy (PE) of subject j
-        Ht=[]
-        for i in range(64):
-            selected_data=self.data[j][i,:self.max_time] #Get channels i for all times 
-            code=perm_indices(selected_data,self.L,self.lag)
-
-            probs=probabilities(code,self.L)
-            Ht=Ht+[entropy(probs)/np.log(math.factorial(self.L))]
-        return Ht
+        # Gets the usual permutation entropy (PE) of every channel of subject j
+        # All 64 channels are encoded at once, one row of codes per channel
+        codes=perm_indices_batch(self.data[j][:64,:self.max_time],self.L,self.lag)
+        return list(entropy_batch(probabilities(codes,self.L)))
+    
+    def PE_durations(self,j,durations):
+        # PE of every channel of subject j using only the first d samples, for each d in
+        # durations (in samples). Shape (durations, 64).
+        # The codes of a shorter window are the first ones of the longer window, so the channels
+        # are encoded once and the symbol counts of each duration are the counts of the previous
+        # one plus those of the new stretch. The result is the same as PE_chanel with max_time=d
+        durations=np.asarray(durations,dtype=int)
+        shortest=(self.L-1)*self.lag+1 #samples of one pattern
+        length=np.asarray(self.data[j]).shape[1]
+        wrong=durations[(durations<shortest)|(durations>length)]
+        if len(wrong):
+            raise Exception("Durations "+str(wrong.tolist())+" not valid, they have to be between "+str(shortest)+
+                            " (one pattern of L="+str(self.L)+" and lag="+str(self.lag)+") and "+str(length)+" (the recording)")
+        codes=perm_indices_batch(self.data[j][:64,:durations.max()],self.L,self.lag)
+        ends=durations-(self.L-1)*self.lag #number of codes in each duration
+        counts=np.zeros((len(durations),codes.shape[0],math.factorial(self.L)),dtype=int)
+        running=np.zeros(counts.shape[1:],dtype=int)
+        start=0
+        for k in np.argsort(durations):
+            running=running+pattern_counts(codes[:,start:ends[k]],self.L)
+            start=ends[k]
+            counts[k]=running
+        return entropy_batch(counts)
+    
+    def PE_duration_sweep(self,durations,subjects=None):
+        # PE_durations for several subjects (all by default), shape (durations, subjects, 64)
+        if subjects is None:
+            subjects=range(self.subjects)
+        return np.stack([self.PE_durations(j,durations) for j in subjects],axis=1)
     
+    def sliding_PE(self,j,window=320,hop=40):
+        # Time resolved PE of every channel of subject j over windows of `window` samples
+        # taken every `hop` samples (default 2 s and 0.25 s at 160 Hz). Shape (64, windows).
+        # The histogram of each channel is updated when the window moves one sample (the
+        # pattern that leaves is removed and the one that enters is added) and so is the
+        # sum of c*log(c), because H = log(n) - sum(c*log(c))/n for n patterns
+        check_window(window,hop,(self.L-1)*self.lag+1)
+        X=np.asarray(self.data[j])[:64,:self.max_time]
+        codes=perm_indices_batch(X,self.L,self.lag)-1
+        n=window-(self.L-1)*self.lag #patterns per window
+        starts=window_starts(X.shape[1],window,hop)
+        if len(starts)==0:
+            return np.zeros((codes.shape[0],0))
+        c=np.arange(n+1)
+        xlogx=c*np.log(np.where(c>0,c,1)) #c*log(c) for every possible count
+        rows=np.arange(codes.shape[0])
+        counts=pattern_counts(codes[:,:n]+1,self.L)
+        S=xlogx[counts].sum(axis=1)
+        H=np.zeros((codes.shape[0],len(starts)))
+        H[:,0]=np.log(n)-S/n
+        for k in range(1,starts[-1]+1):
+            leaving=codes[:,k-1]
+            c_out=counts[rows,leaving]
+            S+=xlogx[c_out-1]-xlogx[c_out]
+            counts[rows,leaving]=c_out-1
+            entering=codes[:,k+n-1]
+            c_in=counts[rows,entering]
+            S+=xlogx[c_in+1]-xlogx[c_in]
+            counts[rows,entering]=c_in+1
+            if k%hop==0:
+                H[:,k//hop]=np.log(n)-S/n
+        return H/np.log(math.factorial(self.L))
+    
+    def sliding_SPE(self,j,window=320,hop=40,montage=None):
+        # Pooled SPE of subject j over windows of `window` samples taken every `hop` samples:
+        # the spatial patterns of all the time samples in the window go to the same histogram.
+        # The histograms come from a running (cumulative) sum of the per-time counts, so
+        # moving the window only adds the samples that enter and removes the ones that leave
+        check_window(window,hop,1) #the spatial patterns of a single sample are already a histogram
+        if montage is None:
+            montage=self.montage
+        counts=self.spatial_counts(j,montage)
+        running=np.concatenate([np.zeros((1,counts.shape[1]),dtype=int),np.cumsum(counts,axis=0)])
+        starts=window_starts(counts.shape[0],window,hop)
+        return entropy_batch(running[starts+window]-running[starts])
+    
+    def extract_features(self, j, features=FEATURES):
+        # Computes the requested statistics (any of FEATURES) of every channel of subject j
+        # in one pass over the (64, max_time) block: the moments are taken along the time
+        # axis and the median and quartiles come from a single quantile call.
+        # Returns a structured array with one row per channel and one field per feature
+        # (e.g. values['kurtosis'] is the kurtosis of the 64 channels)
+        lags = {}
+        for feature in features:
+            if feature.startswith('autocorr_') and feature[9:].isdigit():
+                lags[feature] = int(feature[9:])
+            elif feature not in FEATURES:
+                raise Exception("Unknown feature '"+str(feature)+"', features have to be in "+str(FEATURES)+" or 'autocorr_<lag>'")
+        X = np.asarray(self.data[j])[:64, :self.max_time]
+        n = X.shape[1]
+        mean = X.mean(axis=1)
+        d = X - mean[:, None]
+        d2 = d**2
+        m2 = d2.mean(axis=1)
+        values = {'mean': mean, 'variance': m2}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if 'skewness' in features or 'kurtosis' in features:
+                m3 = (d2*d).mean(axis=1)
+                m4 = (d2**2).mean(axis=1)
+                values['skewness'] = m3/m2**1.5  # same as scipy skew (biased)
+                values['kurtosis'] = m4/m2**2 - 3  # same as scipy kurtosis (Fisher, biased)
+            if 'autocorr' in features:
+                values['autocorr'] = (d[:, 1:]*d[:, :-1]).sum(axis=1)/m2/n  # lag 1, as autocorr(x,2)[1]
+        if lags or 'decorrelation' in features:
+            corr = autocorr(X, n)  # all the lags at once with the FFT
+            for feature in lags:
+                values[feature] = corr[:, lags[feature]]
+            below = corr < 1/np.e
+            values['decorrelation'] = np.where(below.any(axis=1), below.argmax(axis=1), n)  # as decorrelation_time
+        if 'mad' in features or 'iqr' in features:
+            q25, median, q75 = np.quantile(X, [0.25, 0.5, 0.75], axis=1)
+            values['iqr'] = q75 - q25
+            values['mad'] = np.median(np.abs(X - median[:, None]), axis=1)
+        result = np.zeros(X.shape[0], dtype=[(feature, float) for feature in features])
+        for feature in features:
+            result[feature] = values[feature]
+        return result
+
     def mean_channel(self, j):
-        mean_values = []
-        for i in range(64):
-            selected_data = self.data[j][i, :self.max_time]  # Get channel i for all times
-            mean_values.append(np.mean(selected_data))  # Compute mean
-        return mean_values
+        return list(self.extract_features(j, ['mean'])['mean'])
 
     def variance_channel(self, j):
-        variance_values = []
-        for i in range(64):
-            selected_data = self.data[j][i, :self.max_time]  # Get channel i for all times
-            variance_values.append(np.var(selected_data))  # Compute variance
-        return variance_values
+        return list(self.extract_features(j, ['variance'])['variance'])
 
     def mad_channel(self, j):
         # Computes the Median Absolute Deviation (MAD) of each EEG channel for subject j
-        mad_values = []
-        for i in range(64):
-            selected_data = self.data[j][i, :self.max_time]  # Get channel i for all times
-            mad_values.append(np.median(np.abs(selected_data - np.median(selected_data))))  # Compute MAD
-        return mad_values
+        return list(self.extract_features(j, ['mad'])['mad'])
     
     def iqr_channel(self, j):
         # Computes the Interquartile Range (IQR) of each EEG channel for subject j
-        iqr_values = []
-        for i in range(64):
-            selected_data = self.data[j][i, :self.max_time]  # Get channel i for all times
-            q75, q25 = np.percentile(selected_data, [75 ,25])
-            iqr_values.append(q75 - q25)  # Compute IQR
-        return iqr_values
+        return list(self.extract_features(j, ['iqr'])['iqr'])
 
     def skewness_channel(self, j):
         # Computes the skewness of each EEG channel for subject j
-        skewness_values = []
-        for i in range(64):
-            selected_data = self.data[j][i, :self.max_time]  # Get channel i for all times
-            skewness_values.append(skew(selected_data))  # Compute skewness
-        return skewness_values
+        return list(self.extract_features(j, ['skewness'])['skewness'])
     
     def kurtosis_channel(self, j):
         # Computes the kurtosis of each EEG channel for subject j
-        kurtosis_values = []
-        for i in range(64):
-            selected_data = self.data[j][i, :self.max_time]  # Get channel i for all times
-            kurtosis_values.append(kurtosis(selected_data))  # Compute kurtosis
-        return kurtosis_values
+        return list(self.extract_features(j, ['kurtosis'])['kurtosis'])
     
     def autocorr_channel(self, j):
-        # Calcula la autocorrelación de cada canal EEG para el sujeto j
-        autocorr_values = []
-        for i in range(64):
-            selected_data = self.data[j][i, :self.max_time]  
-            autocorr_values.append(autocorr(selected_data, 2)[1]) 
-        return autocorr_values
+        # Calcula la autocorrelación (lag 1) de cada canal EEG para el sujeto j
+        return list(self.extract_features(j, ['autocorr'])['autocorr'])
     
         
     
@@ -415,48 +744,152 @@ class eeg:
         return pos 
     
 
-def autocorr(x,lags):
+def spatial_counts(data,words,L):
+    # Symbol histogram of the spatial words (a table from compile_montage) at every time
+    # sample of a (channels, time) array, shape (time, L!). The signal is gathered into a
+    # (time, words, L) tensor and encoded at once
+    tensor=np.asarray(data).T[:,words]
+    codes=ordinal_code(tensor)
+    codes[np.isnan(tensor).any(axis=-1)]=0 #words with missing values are not counted, as in spatial_code
+    return pattern_counts(codes,L)
+
+_filters = {} #(method, sfreq, cut_low, cut_up, order) -> filter coefficients
+
+def design_filter(sfreq,cut_low,cut_up,method='fir',order=4):
+    # Coefficients of the band-pass (or low/high-pass if one of the cuts is None), designed
+    # once per band and reused for all the subjects. 'fir' gives the same filter that
+    # mne.filter.filter_data designs by default, 'iir' a Butterworth filter in SOS form
+    key=(method,sfreq,cut_low,cut_up,order)
+    if key not in _filters:
+        if method=='fir':
+            _filters[key]=mne.filter.create_filter(None,sfreq,cut_low,cut_up,verbose=False)
+        elif method=='iir':
+            if cut_low is not None and cut_up is not None:
+                _filters[key]=scipy.signal.butter(order,[cut_low,cut_up],btype='bandpass',fs=sfreq,output='sos')
+            elif cut_up is not None:
+                _filters[key]=scipy.signal.butter(order,cut_up,btype='lowpass',fs=sfreq,output='sos')
+            else:
+                _filters[key]=scipy.signal.butter(order,cut_low,btype='highpass',fs=sfreq,output='sos')
+        else:
+            raise Exception("Filter method not specified or incorrect, it has to be 'fir' or 'iir'")
+    return _filters[key]
+
+def apply_filter(data,sfreq,cut_low,cut_up,method='fir',order=4):
+    # Zero-phase filtering of all the channels (last axis is time) in one call
+    coefs=design_filter(sfreq,cut_low,cut_up,method,order)
+    if method=='iir':
+        return scipy.signal.sosfiltfilt(coefs,data,axis=-1)
+    # linear-phase FIR of odd length: padding (N-1)/2 samples at each side (odd reflection, as
+    # mne does) and keeping the 'valid' part of the convolution removes the delay
+    pad=(len(coefs)-1)//2
+    data=np.asarray(data)
+    padded=np.pad(data,[(0,0)]*(data.ndim-1)+[(pad,pad)],mode='reflect',reflect_type='odd') if data.shape[-1]>pad else \
+        np.pad(data,[(0,0)]*(data.ndim-1)+[(pad,pad)])
+    return scipy.signal.oaconvolve(padded,coefs.reshape((1,)*(data.ndim-1)+(-1,)),mode='valid',axes=-1)
+
+def window_starts(n,window,hop):
+    # First sample of every window of length window, moved hop samples each time, that fits in n samples
+    return np.arange(0,n-window+1,hop)
+
+def check_window(window,hop,shortest):
+    # The windows of sliding_PE/sliding_SPE need at least `shortest` samples and hop >= 1
+    if window<shortest or hop<1:
+        raise Exception("Window of "+str(window)+" samples and hop of "+str(hop)+" not valid, the window "
+                        "needs at least "+str(shortest)+" samples and the hop at least 1")
 
-    mean=np.mean(x)
-    var=np.var(x)
-    xp=x-mean
-    corr=np.correlate(xp,xp,'full')[len(x)-1:]/var/len(x)
-    return corr[:lags]
+def autocorr(x,lags):
+    # Autocorrelation of x, or of every row of a (channels, time) matrix, computed with the
+    # FFT (n log n instead of the n^2 of np.correlate). lags can be a number, which gives the
+    # lags 0 to lags-1 as before, or a list of the lags wanted
+    x=np.asarray(x,dtype=float)
+    n=x.shape[-1]
+    xp=x-np.mean(x,axis=-1,keepdims=True)
+    var=np.mean(xp**2,axis=-1,keepdims=True)
+    nfft=scipy.fft.next_fast_len(2*n-1,real=True) #zero padding so the correlation is not circular
+    spectrum=scipy.fft.rfft(xp,nfft,axis=-1)
+    corr=scipy.fft.irfft(spectrum*np.conj(spectrum),nfft,axis=-1)[...,:n]/var/n
+    if np.ndim(lags)==0:
+        return corr[...,:lags]
+    return corr[...,np.asarray(lags)]
 
 #autocorr(data,2)[1]
 
+def decorrelation_time(x,threshold=1/np.e):
+    # First lag (in samples) where the autocorrelation of x, or of each row of x, goes below
+    # threshold. If it never does the length of the signal is returned
+    corr=autocorr(x,np.shape(x)[-1])
+    below=corr<threshold
+    return np.where(below.any(axis=-1),below.argmax(axis=-1),np.shape(x)[-1])
+
 def perm_indices(ts, wl, lag):
-    m = len(ts) - (wl - 1)*lag
-    indcs = np.zeros(m, dtype=int)
-    for i in range(1,wl):
-        st = ts[(i - 1)*lag : m + ((i - 1)*lag)]
-        for j in range(i,wl):
-            zipped=zip(st,ts[j*lag : m+j*lag])
-            indcs += [x > y for (x, y) in zipped]
-        indcs*= wl - i
-    return indcs + 1
+    # Ordinal pattern code (1 to wl!) of every window of wl points separated by lag.
+    # The windows are taken along the last axis, so ts can be one channel or a
+    # (channels, time) matrix and all channels are encoded in the same call.
+    ts = np.asarray(ts)
+    windows = sliding_window_view(ts, (wl - 1)*lag + 1, axis=-1)[..., ::lag]
+    return ordinal_code(windows)
 
 
-def entropy(probs):
-    h=0
-    for i in range(len(probs)):
-        if probs[i]==0:
-            continue
-        else:
-            h=h-probs[i]*np.log(probs[i])
-    return h
+def perm_indices_batch(data, wl, lag):
+    # Same as perm_indices but always gives back a (channels, windows) integer array
+    data = np.asarray(data)
+    return perm_indices(data.reshape(-1, data.shape[-1]), wl, lag)
 
-def probabilities(code,L):
-    get_indexes = lambda x, xs: [k for (y, k) in zip(xs, range(len(xs))) if x == y]
-    probs=[]
-    for i in range(1,math.factorial(L)+1):
-            
-                
-        probs=probs + [len(get_indexes(i,code))/len(code)
-                   ]
-        
-        #print(self.entropy(probabilities))
-    return probs 
 
+def ordinal_code(words):
+    # Lehmer code of the words stored in the last axis. For every position p we count
+    # how many of the following values are smaller and weight it by (wl-1-p)!, which
+    # gives exactly the same numbers as the old nested loop (ties and NaN compare as False)
+    wl = words.shape[-1]
+    greater = words[..., :, None] > words[..., None, :]
+    upper = np.triu(np.ones((wl, wl), dtype=bool), 1)
+    counts = (greater & upper).sum(axis=-1)
+    weights = np.array([math.factorial(wl - 1 - p) for p in range(wl)])
+    return counts @ weights + 1
 
 
+def entropy(probs):
+    # Shannon entropy (natural log) of the probabilities in the last axis, 0*log(0) counts as 0
+    # The sum goes symbol by symbol, each step over all the rows at once, so a single
+    # vector gives the same number as the old element by element loop.
+    # A row with NaN (no pattern counted, 0/0) gives NaN, not 0
+    probs=np.asarray(probs,dtype=float)
+    h=np.zeros(probs.shape[:-1])
+    for k in range(probs.shape[-1]):
+        p=probs[...,k]
+        h=h-np.where(p>0,p*np.log(np.where(p>0,p,1)),0)
+    h=np.where(np.isnan(probs).any(axis=-1),np.nan,h)
+    return h[()]
+
+def entropy_batch(probs):
+    # Normalized entropy of every row of a (N, L!) matrix of probabilities or counts
+    # Integer input is taken as counts and turned into probabilities row by row
+    probs=np.asarray(probs)
+    if np.issubdtype(probs.dtype,np.integer):
+        probs=normalize_counts(probs)
+    return entropy(probs)/np.log(probs.shape[-1])
+
+def pattern_counts(code,L):
+    # Number of times each of the L! symbols appears in code (codes go from 1 to L!,
+    # a code 0 marks a skipped word and is not counted)
+    # With a 2-D code array every row gets its own histogram: the rows are shifted by
+    # row*(L!+1) so a single bincount does all of them
+    code=np.asarray(code,dtype=int)
+    n_bins=math.factorial(L)+1
+    if code.ndim==1:
+        return np.bincount(code,minlength=n_bins)[1:]
+    rows=code.shape[0]
+    offset=(np.arange(rows)*n_bins)[:,None]
+    counts=np.bincount((code+offset).ravel(),minlength=rows*n_bins)
+    return counts.reshape(rows,n_bins)[:,1:]
+
+def probabilities(code,L):
+    # Relative frequency of each symbol, one row per code sequence for 2-D input
+    return normalize_counts(pattern_counts(code,L))
+
+def normalize_counts(counts):
+    # Counts to probabilities along the last axis. A row without counts (every word had a NaN)
+    # has no probabilities: it becomes NaN, so its entropy is NaN instead of 0
+    total=counts.sum(axis=-1,keepdims=True)
+    with np.errstate(invalid='ignore'):
+        return counts/total
@@ -1,4 +1,4 @@
-from tqdm import tqdm  # For progress bar during loops
+from functools import partial
 import numpy as np
 import multiprocess as mp  # To parallelize entropy calculations
 from datetime import datetime
@@ -46,40 +46,28 @@ eeg_closed.load_data()
 # 4. Analyze entropy at different time windows
 # --------------------------------------------------
 
-open_promedio = []  # Mean PE for EO
-open_sd = []        # Std dev PE for EO
+time = [10, 20, 30, 40, 50, 59]  # Window sizes in seconds
+durations = [i * 160 for i in time]  # Window sizes in samples (160 Hz)
 
-closed_promedio = []  # Mean PE for EC
-closed_sd = []        # Std dev PE for EC
+if analysis_mode == 'spatial':
+    startTime = datetime.now()
 
-time = [10, 20, 30, 40, 50, 59]  # Window sizes in seconds
+    # Each subject is encoded once and PE is obtained for all the window sizes,
+    # the result of each subject has shape (durations, channels)
+    if __name__ == '__main__':
+        with mp.Pool(mp.cpu_count()) as pool:
+            pe_eyes_open = pool.map(partial(eeg_open.PE_durations, durations=durations), range(eeg_open.subjects))
+            pe_eyes_closed = pool.map(partial(eeg_closed.PE_durations, durations=durations), range(eeg_closed.subjects))
+
+    # (durations, subjects, channels)
+    pe_eyes_open = np.stack(pe_eyes_open, axis=1)
+    pe_eyes_closed = np.stack(pe_eyes_closed, axis=1)
+
+    open_promedio = [np.mean(pe) for pe in pe_eyes_open]  # Mean PE for EO
+    open_sd = [np.std(pe) for pe in pe_eyes_open]         # Std dev PE for EO
 
-for i in tqdm(time):
-    eeg_open.max_time = i * 160     # Set window size in samples (160 Hz)
-    eeg_closed.max_time = i * 160
-
-    if analysis_mode == 'spatial':
-        startTime = datetime.now()
-
-        # Compute PE for EO using multiprocessing
-        if __name__ == '__main__':
-            pool = mp.Pool(mp.cpu_count())
-            pe_eyes_open = pool.map(eeg_open.PE_chanel, range(eeg_open.subjects))
-            pool.close()
-            pool.join()
-        
-        open_promedio.append(np.mean(pe_eyes_open))
-        open_sd.append(np.std(pe_eyes_open))
-
-        # Compute PE for EC using multiprocessing
-        if __name__ == '__main__':
-            pool = mp.Pool(mp.cpu_count())
-            pe_eyes_closed = pool.map(eeg_closed.PE_chanel, range(eeg_closed.subjects))
-            pool.close()
-            pool.join()
-
-        closed_promedio.append(np.mean(pe_eyes_closed))
-        closed_sd.append(np.std(pe_eyes_closed))
+    closed_promedio = [np.mean(pe) for pe in pe_eyes_closed]  # Mean PE for EC
+    closed_sd = [np.std(pe) for pe in pe_eyes_closed]         # Std dev PE for EC
 
 # --------------------------------------------------
 # 5. Print execution time and status
@@ -110,5 +98,5 @@ plt.savefig("eeg_plot.png", dpi=300, bbox_inches='tight')
 # 7. Save final PE results for later use
 # --------------------------------------------------
 
-np.save('EC_PE_RAW_WO_50', np.array(pe_eyes_closed))
-np.save('EO_PE_RAW_WO_50', np.array(pe_eyes_open))
\ No newline at end of file
+np.save('EC_PE_RAW_WO_50', pe_eyes_closed[-1])
+np.save('EO_PE_RAW_WO_50', pe_eyes_open[-1])
\ No newline at end of file
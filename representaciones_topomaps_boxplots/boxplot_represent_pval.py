@@ -10,6 +10,7 @@
 from scipy import stats
 import numpy as np
 import matplotlib.pyplot as plt
+from egg_store import result_store
 
 # Function to draw a boxplot with the p-value comparison between EC and EO
 
@@ -71,17 +72,24 @@ def plot_boxplot_subplot(ax, ec_data, eo_data, ylabel, label_letter):
 # Load feature data averaged per subject (Alpha band, no artifacts)
 # ---------------------------------------------------------------
 
+# (looked up by parameters in the result store, see egg_store.py)
+store = result_store()
+alpha = dict(mode='filt', band='alpha', L=4, lag=1, montage='64', artifacts='without', channels=59)
+
+def subject_mean(metric, run):
+    return np.mean(store.get(metric=metric, run=run, **alpha), axis=1)
+
 # Load PE data
-ec_without_pe = np.mean(np.load("tabla_pe_skew_kurt_raw_rawwo_bewo/EC_PE_ALPHA_4_1_W_59.npy"), axis=1)
-eo_without_pe = np.mean(np.load("tabla_pe_skew_kurt_raw_rawwo_bewo/EO_PE_ALPHA_4_1_W_59.npy"), axis=1)
+ec_without_pe = subject_mean('pe', 2)
+eo_without_pe = subject_mean('pe', 1)
 
 # Load Skewness data
-ec_without_skew = np.mean(np.load("tabla_pe_skew_kurt_raw_rawwo_bewo/EC_skewness_ALPHA_4_1_W_59.npy"), axis=1)
-eo_without_skew = np.mean(np.load("tabla_pe_skew_kurt_raw_rawwo_bewo/EO_skewness_ALPHA_4_1_W_59.npy"), axis=1)
+ec_without_skew = subject_mean('skew', 2)
+eo_without_skew = subject_mean('skew', 1)
 
 # Load Kurtosis data
-ec_without_kurt = np.mean(np.load("tabla_pe_skew_kurt_raw_rawwo_bewo/EC_kurtosis_ALPHA_4_1_W_59.npy"), axis=1)
-eo_without_kurt = np.mean(np.load("tabla_pe_skew_kurt_raw_rawwo_bewo/EO_kurtosis_ALPHA_4_1_W_59.npy"), axis=1)
+ec_without_kurt = subject_mean('kurt', 2)
+eo_without_kurt = subject_mean('kurt', 1)
 
 # ---------------------------------------------------------------
 # Create figure with 3 boxplots (one for each metric)
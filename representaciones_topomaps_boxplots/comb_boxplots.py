@@ -9,6 +9,7 @@
 from scipy import stats
 import numpy as np
 import matplotlib.pyplot as plt
+from egg_store import result_store
 
 # Function to draw boxplots and show p-values for each pair
 
@@ -81,23 +82,30 @@ def plot_boxplot_subplot(ax, ec_with, eo_with, ec_without, eo_without, ylabel, l
 # Load data averaged by subject
 # ----------------------------
 
+# (looked up by parameters in the result store, see egg_store.py)
+store = result_store()
+beta = dict(mode='filt', band='beta', L=4, lag=1, montage='64', collection='MATRIX_FINAL_VALUES')
+
+def subject_mean(metric, run, artifacts):
+    return np.mean(store.get(metric=metric, run=run, artifacts=artifacts, **beta), axis=1)
+
 # Load PE data
-ec_with_pe = np.mean(np.load("MATRIX_FINAL_VALUES/EC_pe_beta_4_1_w.npy"), axis=1)
-eo_with_pe = np.mean(np.load("MATRIX_FINAL_VALUES/EO_pe_beta_4_1_W.npy"), axis=1)
-ec_without_pe = np.mean(np.load("MATRIX_FINAL_VALUES/EC_pe_beta_4_1_wo.npy"), axis=1)
-eo_without_pe = np.mean(np.load("MATRIX_FINAL_VALUES/EO_pe_beta_4_1_Wo.npy"), axis=1)
+ec_with_pe = subject_mean('pe', 2, 'with')
+eo_with_pe = subject_mean('pe', 1, 'with')
+ec_without_pe = subject_mean('pe', 2, 'without')
+eo_without_pe = subject_mean('pe', 1, 'without')
 
 # Load Skewness data
-ec_with_skew = np.mean(np.load("MATRIX_FINAL_VALUES/EC_skew_beta_4_1_w.npy"), axis=1)
-eo_with_skew = np.mean(np.load("MATRIX_FINAL_VALUES/EO_skew_beta_4_1_W.npy"), axis=1)
-ec_without_skew = np.mean(np.load("MATRIX_FINAL_VALUES/EC_skew_beta_4_1_wo.npy"), axis=1)
-eo_without_skew = np.mean(np.load("MATRIX_FINAL_VALUES/EO_skew_beta_4_1_Wo.npy"), axis=1)
+ec_with_skew = subject_mean('skew', 2, 'with')
+eo_with_skew = subject_mean('skew', 1, 'with')
+ec_without_skew = subject_mean('skew', 2, 'without')
+eo_without_skew = subject_mean('skew', 1, 'without')
 
 # Load Kurtosis data
-ec_with_kurt = np.mean(np.load("MATRIX_FINAL_VALUES/EC_kurt_beta_4_1_w.npy"), axis=1)
-eo_with_kurt = np.mean(np.load("MATRIX_FINAL_VALUES/EO_kurt_beta_4_1_W.npy"), axis=1)
-ec_without_kurt = np.mean(np.load("MATRIX_FINAL_VALUES/EC_kurt_beta_4_1_wo.npy"), axis=1)
-eo_without_kurt = np.mean(np.load("MATRIX_FINAL_VALUES/EO_kurt_beta_4_1_Wo.npy"), axis=1)
+ec_with_kurt = subject_mean('kurt', 2, 'with')
+eo_with_kurt = subject_mean('kurt', 1, 'with')
+ec_without_kurt = subject_mean('kurt', 2, 'without')
+eo_without_kurt = subject_mean('kurt', 1, 'without')
 
 # ----------------------------
 # Create the final figure with 3 vertical subplots
@@ -10,17 +10,20 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 import mne
-from scipy import stats
+from egg_store import result_store
+from egg_stats import compare, summary, permutation_test, adjacency, cluster_test
 
-# Load EEG data for each feature and condition (subjects × channels)
-pe_eyes_closed = np.load('MATRIX_FINAL_VALUES/EC_pe_raw_4_1_w.npy')
-pe_eyes_open = np.load('MATRIX_FINAL_VALUES/EO_pe_raw_4_1_W.npy')
+# Load EEG data for each feature and condition (subjects × channels) from the result store
+store = result_store()
+params = dict(mode='raw', band=None, L=4, lag=1, montage='64', artifacts='with', collection='MATRIX_FINAL_VALUES')
+pe_eyes_closed = store.get(metric='pe', run=2, **params)
+pe_eyes_open = store.get(metric='pe', run=1, **params)
 
-skew_ec = np.load('MATRIX_FINAL_VALUES/EC_skew_raw_4_1_w.npy')
-skew_eo = np.load('MATRIX_FINAL_VALUES/EO_skew_raw_4_1_W.npy')
+skew_ec = store.get(metric='skew', run=2, **params)
+skew_eo = store.get(metric='skew', run=1, **params)
 
-kurt_ec = np.load('MATRIX_FINAL_VALUES/EC_kurt_raw_4_1_w.npy')
-kurt_eo = np.load('MATRIX_FINAL_VALUES/EO_kurt_raw_4_1_W.npy')
+kurt_ec = store.get(metric='kurt', run=2, **params)
+kurt_eo = store.get(metric='kurt', run=1, **params)
 
 # Load electrode montage from an EDF file
 edf_path = 'files-2/S001/S001R01.edf'
@@ -29,18 +32,28 @@ raw.load_data()
 mne.datasets.eegbci.standardize(raw)
 raw.set_montage("standard_1005")
 
+# Neighbouring electrodes for the cluster test, from the standard_1005 positions of the montage
+positions = np.array([ch['loc'][:3] for ch in raw.info['chs']])
+neighbours = adjacency(positions)
+
 # Function to compute statistics between EO and EC for each electrode
+# (all the channels in one call, see egg_stats.py). The p-value map is from a permutation
+# test of the Welch t (10000 shuffles of the EO/EC labels), so no normality is assumed
 def compute_stats(eo, ec):
-    av_eo = np.mean(eo, axis=0)
-    av_ec = np.mean(ec, axis=0)
-    t_stats, p_vals = stats.ttest_ind(eo, ec, axis=0, equal_var=False)
-    diff = av_eo - av_ec
-    return av_eo, av_ec, diff, p_vals
+    res = compare(eo, ec)
+    summary(res)
+    perm = permutation_test(eo, ec, seed=0)
+    print('Permutation test: significant channels =', np.count_nonzero(perm['p'] < 0.05),
+          ', with max-statistic correction =', np.count_nonzero(perm['p_fwer'] < 0.05))
+    # electrodes in significant clusters of neighbours (cluster permutation test), marked in the difference map
+    clus = cluster_test(eo, ec, neighbours, seed=0)
+    print('Cluster test: cluster p-values =', clus['cluster_p'], ', channels in significant clusters =', np.count_nonzero(clus['mask']))
+    return res['mean_a'], res['mean_b'], res['diff'], perm['p'], clus['mask']
 
 # Calculate statistics for each metric
-av_pe_eo, av_pe_ec, diff_pe, pval_pe = compute_stats(pe_eyes_open, pe_eyes_closed)
-av_skew_eo, av_skew_ec, diff_skew, pval_skew = compute_stats(skew_eo, skew_ec)
-av_kurt_eo, av_kurt_ec, diff_kurt, pval_kurt = compute_stats(kurt_eo, kurt_ec)
+av_pe_eo, av_pe_ec, diff_pe, pval_pe, mask_pe = compute_stats(pe_eyes_open, pe_eyes_closed)
+av_skew_eo, av_skew_ec, diff_skew, pval_skew, mask_skew = compute_stats(skew_eo, skew_ec)
+av_kurt_eo, av_kurt_ec, diff_kurt, pval_kurt, mask_kurt = compute_stats(kurt_eo, kurt_ec)
 
 # Prepare figure layout (3 rows × 4 columns)
 plt.rcParams.update({'font.size': 32})
@@ -49,13 +62,13 @@ plt.subplots_adjust(bottom=0.2, hspace=0.5)
 
 # List of metrics to loop over
 metrics = [
-    ("a)", av_pe_eo, av_pe_ec, diff_pe, pval_pe),
-    ("b)", av_skew_eo, av_skew_ec, diff_skew, pval_skew),
-    ("c)", av_kurt_eo, av_kurt_ec, diff_kurt, pval_kurt)
+    ("a)", av_pe_eo, av_pe_ec, diff_pe, pval_pe, mask_pe),
+    ("b)", av_skew_eo, av_skew_ec, diff_skew, pval_skew, mask_skew),
+    ("c)", av_kurt_eo, av_kurt_ec, diff_kurt, pval_kurt, mask_kurt)
 ]
 
 # Generate topographic plots for each metric
-for i, (label, eo, ec, diff, pval) in enumerate(metrics):
+for i, (label, eo, ec, diff, pval, mask) in enumerate(metrics):
     # Define limits for consistent color scales
     vmin = min(eo.min(), ec.min())
     vmax = max(eo.max(), ec.max())
@@ -71,9 +84,10 @@ for i, (label, eo, ec, diff, pval) in enumerate(metrics):
                                   image_interp='cubic', vlim=(vmin, vmax), axes=axes[i][1], show=False)
     axes[i][1].set_title("EC", fontsize=32, fontweight='bold')
 
-    # Plot difference map (EO - EC)
+    # Plot difference map (EO - EC), electrodes of significant clusters marked in white
     im3, _ = mne.viz.plot_topomap(diff, raw.info, cmap='coolwarm', contours=0,
-                                  image_interp='cubic', vlim=(-diff_lim, diff_lim), axes=axes[i][2], show=False)
+                                  image_interp='cubic', vlim=(-diff_lim, diff_lim), axes=axes[i][2], show=False,
+                                  mask=mask, mask_params=dict(marker='o', markerfacecolor='w', markersize=8))
     axes[i][2].set_title("Difference", fontsize=32, fontweight='bold')
 
     # Plot p-value map (use log scale only for first row)
@@ -10,6 +10,7 @@
 from scipy import stats
 import numpy as np
 import matplotlib.pyplot as plt
+from egg_store import result_store
 
 # Function to create a boxplot with p-value annotation
 
@@ -71,11 +72,13 @@ def plot_boxplot_subplot(ax, ec_with, eo_with, ec_without, eo_without, ylabel, l
     ax.text(-0.15, 1.05, label_letra, transform=ax.transAxes,
             fontsize=22, fontweight='bold', va='top', ha='left')
 
-# Load full data for PE (64 electrodes)
-ec_with_pe = np.load("tabla_pe_skew_kurt_raw_rawwo_bewo/EC_PE_raw_4_1_w.npy")
-eo_with_pe = np.load("tabla_pe_skew_kurt_raw_rawwo_bewo/EO_PE_raw_4_1_W.npy")
-ec_without_pe = np.load("tabla_pe_skew_kurt_raw_rawwo_bewo/EC_PE_raw_4_1.npy")
-eo_without_pe = np.load("tabla_pe_skew_kurt_raw_rawwo_bewo/EO_PE_raw_4_1.npy")
+# Load full data for PE (64 electrodes) from the result store
+store = result_store()
+pe = dict(metric='pe', mode='raw', band=None, L=4, lag=1, montage='64', collection='tabla_pe_skew_kurt')
+ec_with_pe = store.get(run=2, artifacts='with', **pe)
+eo_with_pe = store.get(run=1, artifacts='with', **pe)
+ec_without_pe = store.get(run=2, artifacts='without', **pe)
+eo_without_pe = store.get(run=1, artifacts='without', **pe)
 
 # Average PE across all 64 electrodes
 ec_with_pe_64 = np.mean(ec_with_pe, axis=1)
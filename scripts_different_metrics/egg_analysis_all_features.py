@@ -0,0 +1,67 @@
+import numpy as np
+import multiprocess as mp
+from datetime import datetime
+from egg_utils_2 import eeg, FEATURES
+
+# This script replaces running egg_analysis_mean/var/MAD/IQR/kurtosis/skew one by one:
+# every subject is read once and all the statistics of the 64 channels are computed
+# together with eeg.extract_features. The features that have their own script are saved
+# with the same names as that script (EC_skew_raw_4_1_w, EC_kurt_raw_4_1, EC_mean_raw...),
+# so the files that read them do not change.
+
+# 1. Here we are defining the parameters
+
+number_of_subjects = 109
+filt_mode = 'raw'
+analysis_mode = 'temporal'
+
+# name of the saved files for each feature, EC_<name> and EO_<name>
+file_names = {'mean': 'mean_' + filt_mode, 'variance': 'var_' + filt_mode, 'mad': 'mad_' + filt_mode,
+              'iqr': 'iqr_' + filt_mode, 'skewness': 'skew_' + filt_mode + '_4_1_w',
+              'kurtosis': 'kurt_' + filt_mode + '_4_1', 'autocorr': 'autocorr_' + filt_mode,
+              'decorrelation': 'decorr_' + filt_mode}
+
+# 2. Here what we are doing is to create the objects
+
+eeg_open = eeg(number_of_subjects, filt_mode, run=1)  # Open eyes
+eeg_closed = eeg(number_of_subjects, filt_mode, run=2)  # Closed eyes
+
+# Parameters
+for eeg_obj in [eeg_open, eeg_closed]:
+    eeg_obj.file_path = '/Users/natalialopezlopezicloud.com/Desktop/Escritorio2/GAIA/eeg-spatial-analysis-main/files-2'
+    eeg_obj.cut_up = 30
+    eeg_obj.cut_low = 12
+
+# 3. Here what we are doing is to load the data and analyze it. Only the main process
+# does it: with the spawn start method (macOS) the workers import this script again and
+# would read all the edf files once more
+
+if analysis_mode == 'temporal':
+    startTime = datetime.now()
+
+    if __name__ == '__main__':
+        eeg_open.load_data()
+        eeg_closed.load_data()
+        # one copy of the signals in shared memory, the workers attach to it
+        eeg_open.share_data()
+        eeg_closed.share_data()
+
+        with mp.Pool(mp.cpu_count()) as pool:
+            features_open = pool.map(eeg_open.extract_features, range(eeg_open.subjects))
+            features_closed = pool.map(eeg_closed.extract_features, range(eeg_closed.subjects))
+        eeg_open.release_data()
+        eeg_closed.release_data()
+
+        # (subjects, channels) structured arrays, one field per feature
+        features_open = np.stack(features_open)
+        features_closed = np.stack(features_closed)
+
+        for feature in FEATURES:
+            print(feature, 'Eyes Open - mean =', np.mean(features_open[feature]), ', std =', np.std(features_open[feature]))
+            print(feature, 'Eyes Closed - mean =', np.mean(features_closed[feature]), ', std =', np.std(features_closed[feature]))
+            np.save('EC_' + file_names[feature], features_closed[feature])
+            np.save('EO_' + file_names[feature], features_open[feature])
+
+        # time of the execution
+        print('Time elapsed:' + str(datetime.now() - startTime))
+        print('Process completed.')
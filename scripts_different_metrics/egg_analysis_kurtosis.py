@@ -1,11 +1,10 @@
-from scipy import stats
-
 import numpy as np
 import multiprocess as mp
 from datetime import datetime
 import matplotlib.pyplot as plt
 import matplotlib
 from egg_utils_2 import eeg
+from egg_stats import compare, summary
 import mne
 import matplotlib.colors as colors
 
@@ -92,22 +91,16 @@ np.save('EO_kurt_raw_4_1',np.array(kurt_eyes_open))
 kurt_eyes_closed=np.array(kurt_eyes_closed) # dimension 
 kurt_eyes_open=np.array(kurt_eyes_open) # dimensión 
 
-t_stats = []
-p_values = []
-
-for chanel in range(64):
-    t_stat, p_val = stats.ttest_ind(kurt_eyes_open[:, chanel], kurt_eyes_closed[:, chanel], equal_var=False)
-    t_stats.append(t_stat)
-    p_values.append(p_val)
-
-#### hay que pasar las listas a arrays 
-t_stats = np.array(t_stats)
-p_values = np.array(p_values)
+# todos los canales a la vez (Welch, como antes), con corrección FDR por los 64 tests
+results = compare(kurt_eyes_open, kurt_eyes_closed)
+summary(results, 'kurt')
+t_stats = results['t_welch']
+p_values = results['p_welch']
 
 
 
-# Establecer un umbral de significancia para resaltar los electrodos donde p < 0.05
-significance_mask = p_values < 0.05
+# Electrodos significativos después de la corrección FDR (results['bonferroni_welch'] para Bonferroni)
+significance_mask = results['fdr_welch']
 
 # 6. VISUALIZACIÓN mne.viz.plot_topomap
 
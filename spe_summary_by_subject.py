@@ -0,0 +1,85 @@
+"""
+This script builds spe_summary_by_subject.csv: the Spatial Permutation Entropy (SPE) of every
+subject for each event of the recording (T0, T1, T2), each band (Raw, Alpha, Beta) and each
+direction of the spatial words (Horizontal, Vertical).
+
+Every edf file is read only once. The annotations give the segments of each event, each band
+is filtered once over the whole recording and the SPE of all the time samples is computed in
+one vectorized call per band and direction (egg_utils_2.spatial_counts). The SPE of an event
+is the mean over the samples of all its segments. Subjects are processed in parallel.
+"""
+
+import csv
+import numpy as np
+import multiprocess as mp
+from datetime import datetime
+import mne
+from egg_utils_2 import eeg, compile_montage, spatial_counts, entropy_batch, apply_filter
+
+# 1. Parameters
+
+number_of_subjects = 108  # subject 109 is left out (not valid values at the end)
+run = 3                   # the runs with T0/T1/T2 annotations are 3 to 14
+word_length = 3
+lag = 1
+montage = '64'
+bands = {'Raw': None, 'Alpha': (8, 12), 'Beta': (12, 30)}
+events = ['T0', 'T1', 'T2']
+directions = {'Horizontal': (word_length, 1), 'Vertical': (1, word_length)}  # (Lx, Ly)
+output = 'spe_summary_by_subject.csv'
+
+eeg_obj = eeg(number_of_subjects, 'raw', run=run)
+eeg_obj.file_path = '/Users/natalialopezlopezicloud.com/Desktop/Escritorio2/GAIA/eeg-spatial-analysis-main/files-2'
+
+
+# 2. SPE of one subject for all the events, bands and directions
+
+def event_masks(raw, n_samples):
+    # Boolean mask of the samples of each event, from the annotations of the recording
+    sfreq = raw.info['sfreq']
+    masks = {event: np.zeros(n_samples, dtype=bool) for event in events}
+    for onset, duration, description in zip(raw.annotations.onset, raw.annotations.duration, raw.annotations.description):
+        if description in masks:
+            first = int(round(onset*sfreq))
+            last = min(n_samples, int(round((onset + duration)*sfreq)))
+            masks[description][first:last] = True
+    return masks
+
+
+def subject_summary(subject_number):
+    raw = mne.io.read_raw_edf(eeg_obj.edf_name(subject_number), verbose=None)
+    data = raw.get_data()
+    masks = event_masks(raw, data.shape[1])
+    subject = 'S' + str(subject_number + 1).zfill(3)
+    rows = []
+    for band, cut in bands.items():
+        if cut is None:
+            signal = data
+        else:
+            signal = apply_filter(data, raw.info['sfreq'], cut[0], cut[1])  # filter designed once per band
+        for direction, (Lx, Ly) in directions.items():
+            words = compile_montage(montage, Lx, Ly, lag)
+            Ht = entropy_batch(spatial_counts(signal, words, word_length))  # SPE of every sample
+            for event in events:
+                rows.append((subject, event, band, direction, np.mean(Ht[masks[event]])))
+    # same order as the table: direction, then band, then event
+    order = {name: k for k, name in enumerate(list(directions) + list(bands) + events)}
+    rows.sort(key=lambda row: (order[row[3]], order[row[2]], order[row[1]]))
+    return rows
+
+
+# 3. Run all the subjects and write the table
+
+if __name__ == '__main__':
+    startTime = datetime.now()
+    with mp.Pool(mp.cpu_count()) as pool:
+        results = pool.map(subject_summary, range(number_of_subjects))
+
+    with open(output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Subject', 'Event', 'Band', 'Direction', 'SPE'])
+        for rows in results:
+            writer.writerows(rows)
+
+    print('Time elapsed:', str(datetime.now() - startTime))
+    print('Summary written to', output)